@@ -0,0 +1,73 @@
+"""
+Times the import of the modules of the package, every module in a new interpreter.
+
+    python -m benchmarks.imports
+    python -m benchmarks.imports --max-seconds 0.5 --output imports.json
+
+The exit code is 1 if a module imports one of the heavy dependencies, which have to be imported when they
+are first used, or if an import is slower than the allowed time over the import of pandas and numpy.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ["src.downloader", "src.datamanipulator", "src.spike_store", "src.streaming", "src.result_store",
+           "src.fit_cache", "src.models", "src.diagnostics", "src.ols", "src.lm_fit", "src.evaluate", "src.plot",
+           "src.render", "src.batch_fit", "src.model_selection", "src.hierarchical", "src.bootstrap"]
+
+HEAVY = ["matplotlib", "lmfit", "scipy.stats", "scipy.optimize", "statsmodels", "sklearn", "requests", "openpyxl"]
+
+# the base is imported first, so the time of a module is its own
+MEASURE = """
+import json, sys, time
+import numpy, pandas
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def time_import(module: str, repeat: int = 3) -> dict:
+    """
+    :param str module: the name of the module
+    :param int repeat: the number of the new interpreters, the fastest import is kept
+    :return dict: the time of the import and the heavy dependencies it imported
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))}
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", MEASURE.format(module=module, heavy=HEAVY)], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run["seconds"])
+    return {"module": module, "seconds": best["seconds"], "heavy": best["heavy"]}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Times the import of the modules of the package.")
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=0.5,
+                        help="the allowed time of an import over the import of pandas and numpy")
+    parser.add_argument("--output", default=None, help="the JSON file to save the results to")
+    args = parser.parse_args(argv)
+
+    results = [time_import(module=module, repeat=args.repeat) for module in args.modules]
+    failed = False
+    for result in results:
+        slow = result["seconds"] > args.max_seconds
+        failed = failed or slow or bool(result["heavy"])
+        flags = ("  SLOW" if slow else "") + (f"  imports {', '.join(result['heavy'])}" if result["heavy"] else "")
+        print(f"{result['module']:24} {result['seconds']:8.4f} s{flags}", flush=True)
+    if args.output is not None:
+        with open(args.output, "w") as out_file:
+            json.dump({"arguments": vars(args), "results": results}, out_file, indent=2)
+    return int(failed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Times the stages of the pipeline on synthetic datasets.
+
+    python -m benchmarks.run --cells 10 100 1000 10000 --output benchmark.json
+    python -m benchmarks.run --cells 10 100 --baseline benchmark.json --tolerance 1.25
+
+The results are saved as JSON. With a baseline the times are compared stage by stage, and the exit code is 1
+if a stage became slower than the tolerance allows.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import warnings
+from contextlib import contextmanager
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_dataset
+from src.datamanipulator import DataManipulator
+from src.evaluate import Evaluate
+from src.lm_fit import LMFit
+from src.models import get_model
+from src.plot import Plotter
+
+THRESHOLDS = [50, 100, 200, 400]
+
+
+@contextmanager
+def working_directory():
+    """
+    Runs in a temporary folder, the files the pipeline saves to ../generated are written next to it.
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.makedirs(os.path.join(folder, "generated"))
+        os.makedirs(os.path.join(folder, "work"))
+        os.chdir(os.path.join(folder, "work"))
+        try:
+            yield
+        finally:
+            os.chdir(previous)
+
+
+def make_stages(data: pd.DataFrame, fit_cells: int, model_name: str) -> dict:
+    """
+    Creates the stages to time, a stage is a setup that is not timed and a run that is.
+    The setups create a new DataManipulator, so the caches are empty when a run starts.
+    :param pd.DataFrame data: the dataset
+    :param int fit_cells: the number of the cells fitted one by one
+    :param str model_name: the name of the fitted model in the registry
+    :return dict: {name of the stage: (setup, run)}
+    """
+    model = get_model(model_name)
+
+    def manipulator():
+        return DataManipulator(data)
+
+    def fitter():
+        data_class = DataManipulator(data)
+        return LMFit(data_class, Plotter(data_class))
+
+    def evaluator():
+        lm_fit = fitter()
+        return Evaluate(lm_fit.data_class, lm_fit, lm_fit.plotter)
+
+    def curve_fit_cells(lm_fit):
+        for name in lm_fit.names[:fit_cells]:
+            lm_fit.create_lmfit_curve_fit(cell_name=name, plot_name=name, range_spike=1, func_class=model,
+                                          param_values=(1, 0), do_all=False, log=True, show=False,
+                                          name_to_save=model_name, save=False)
+
+    def curve_fit_pooled(lm_fit):
+        lm_fit.create_lmfit_curve_fit(cell_name="all", plot_name="all", range_spike=2, func_class=model,
+                                      param_values=(1, 0), do_all=True, log=True, show=False,
+                                      name_to_save=model_name, save=False)
+
+    def count_if_threshold(evaluate):
+        evaluate.count_if_threshold(cell_name="all", spike_name="1.spike", func_class=model, param_values=(1, 0),
+                                    threshold=THRESHOLDS, ax=None, chosen_cells=list(evaluate.data_class.names),
+                                    linear_regression=False, log=True)
+        plt.close("all")
+
+    return {
+        "DataManipulator": (lambda: None, lambda _: DataManipulator(data)),
+        "measurements": (manipulator, lambda data_class: data_class.measurements()),
+        "create_spike_frame": (manipulator, lambda data_class: data_class.create_spike_frame()),
+        "create_frame": (manipulator, lambda data_class: data_class.create_frame(
+            cell_name="all", spike="1.spike", y=False, do_all=True, chosen_cells=None)),
+        "define_axes": (manipulator, lambda data_class: data_class.define_axes(
+            cell_name="all", string="1.spike", do_all=True, log=True, switch_axes=False, chosen_cells=None)),
+        "create_lmfit_curve_fit cells": (fitter, curve_fit_cells),
+        "create_lmfit_curve_fit pooled": (fitter, curve_fit_pooled),
+        "count_if_threshold": (evaluator, count_if_threshold),
+    }
+
+
+def run_benchmarks(cells: list, repeat: int = 3, stages: list = None, fit_cells: int = 10,
+                   model_name: str = "log_linear", seed: int = 0) -> list:
+    """
+    :param list cells: the numbers of the cells of the datasets
+    :param int repeat: the number of the runs of a stage, the fastest one is kept
+    :param list stages: the names of the stages to run, by default every stage
+    :param int fit_cells: the number of the cells fitted one by one
+    :param str model_name: the name of the fitted model in the registry
+    :param int seed: the seed of the datasets
+    :return list: {"stage", "cells", "seconds", "repeat"} for every stage and dataset
+    """
+    results = []
+    with working_directory(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for n_cells in cells:
+            data = make_dataset(n_cells=n_cells, seed=seed)
+            for name, (setup, run) in make_stages(data=data, fit_cells=fit_cells, model_name=model_name).items():
+                if stages is not None and name not in stages:
+                    continue
+                times = []
+                for _ in range(repeat):
+                    argument = setup()
+                    start = time.perf_counter()
+                    run(argument)
+                    times.append(time.perf_counter() - start)
+                results.append({"stage": name, "cells": n_cells, "seconds": min(times), "repeat": repeat})
+                print(f"{name:32} {n_cells:>6} cells {min(times):10.4f} s", flush=True)
+    return results
+
+
+def compare(results: list, baseline: list, tolerance: float) -> pd.DataFrame:
+    """
+    :param list results: the current results
+    :param list baseline: the stored results
+    :param float tolerance: the allowed ratio of the current and the stored time
+    :return pd.DataFrame: the times and their ratio for the stages that are in both, with a regression column
+    """
+    current = pd.DataFrame(results).set_index(["stage", "cells"])["seconds"]
+    stored = pd.DataFrame(baseline).set_index(["stage", "cells"])["seconds"]
+    table = pd.concat({"baseline": stored, "current": current}, axis=1, join="inner")
+    table["ratio"] = table["current"] / table["baseline"]
+    table["regression"] = table["ratio"] > tolerance
+    return table
+
+
+def environment() -> dict:
+    """
+    :return dict: the versions and the machine the benchmark ran on
+    """
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Times the pipeline on synthetic datasets.")
+    parser.add_argument("--cells", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", default=None)
+    parser.add_argument("--fit-cells", type=int, default=10)
+    parser.add_argument("--model", default="log_linear")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="the JSON file to save the results to")
+    parser.add_argument("--baseline", default=None, help="the JSON file of the results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(cells=args.cells, repeat=args.repeat, stages=args.stages, fit_cells=args.fit_cells,
+                             model_name=args.model, seed=args.seed)
+    if args.output is not None:
+        with open(args.output, "w") as out_file:
+            json.dump({"environment": environment(), "arguments": vars(args), "results": results}, out_file,
+                      indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as in_file:
+            table = compare(results=results, baseline=json.load(in_file)["results"], tolerance=args.tolerance)
+        print(table.to_string())
+        return int(table["regression"].any())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
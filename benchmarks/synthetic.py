@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+
+def make_dataset(n_cells: int, trains_per_cell: int = 4, spikes_per_train: int = 8, noise: float = 0.05,
+                 ragged: bool = True, seed: int = 0) -> pd.DataFrame:
+    """
+    Creates a dataset shaped like the Downloader's output.
+    Every cell has two columns, (cell, "relative firing time") and (cell, "IF"), the spike trains follow each other
+    separated by a NaN row and the shorter cells are padded with NaN values. The IF decays like a power of the
+    relative firing time, with multiplicative noise.
+    :param int n_cells: the number of the cells
+    :param int trains_per_cell: the number of the spike trains of a cell
+    :param int spikes_per_train: the number of the spikes of a train, the maximum if ragged
+    :param float noise: the standard deviation of the logarithm of the noise
+    :param bool ragged: if true the trains have random lengths between 1 and spikes_per_train
+    :param int seed: the seed of the random generator
+    :return pd.DataFrame: the dataset
+    """
+    rng = np.random.default_rng(seed)
+    train_rows = spikes_per_train + 1
+    n_rows = trains_per_cell * train_rows
+    lengths = rng.integers(1, spikes_per_train + 1, size=(n_cells, trains_per_cell)) if ragged else \
+        np.full((n_cells, trains_per_cell), spikes_per_train)
+    position = np.arange(spikes_per_train)
+    valid = position[None, None, :] < lengths[:, :, None]
+
+    times = np.sort(rng.uniform(1, 250, size=(n_cells, trains_per_cell, spikes_per_train)), axis=2)[:, :, ::-1]
+    exponent = rng.uniform(0.3, 0.7, size=(n_cells, 1, 1))
+    ifs = 300 * times ** -exponent * rng.lognormal(0, noise, size=times.shape)
+    times, ifs = np.where(valid, times, np.nan), np.where(valid, ifs, np.nan)
+    padding = np.full((n_cells, trains_per_cell, 1), np.nan)
+    times = np.concatenate((times, padding), axis=2).reshape(n_cells, n_rows)
+    ifs = np.concatenate((ifs, padding), axis=2).reshape(n_cells, n_rows)
+
+    values = np.empty((n_rows, 2 * n_cells))
+    values[:, 0::2] = times.T
+    values[:, 1::2] = ifs.T
+    columns = pd.MultiIndex.from_product([[f"cell{i}" for i in range(n_cells)], ["relative firing time", "IF"]])
+    return pd.DataFrame(values, columns=columns)
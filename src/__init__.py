@@ -1,4 +1,2 @@
 import os
-import sys
 PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.realpath("__file__")))
-sys.path.append(PROJECT_PATH)
\ No newline at end of file
@@ -0,0 +1,167 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import pandas as pd
+
+from src.diagnostics import diagnose
+from src.lm_fit import LMFit, fitted_curve, minimize_function, multi_start_fit, plain_result
+from src.models import Model, model_name
+
+
+class FitJob(NamedTuple):
+    """
+    One spike's fitting of a cell, of the chosen cells or of all cells.
+    The func_class has to be importable (defined on module level) to be sent to the worker processes.
+    """
+    cell_name: str
+    spike: int
+    func_class: object
+    param_values: tuple
+    name_to_save: str
+    log: bool = True
+    switch_axes: bool = False
+    do_all: bool = False
+    chosen_cells: list = None
+
+    @property
+    def label(self) -> str:
+        """
+        :return str: the name of the fitted cells, as in LMFit.bad_fitting
+        """
+        if self.do_all:
+            return "all"
+        elif isinstance(self.chosen_cells, list):
+            return str(self.chosen_cells)
+        return self.cell_name
+
+
+def make_jobs(cells: list, range_spike: int, func_classes: list, param_values: tuple, log: bool = True,
+              switch_axes: bool = False) -> list:
+    """
+    Creates the grid of the fittings, the results are saved under the name of the func_class.
+    :param list cells: the name of a cell, a list of names for chosen cells or None for all cells
+    :param int range_spike: the number of the spikes to fit, starting from the first
+    :param list func_classes: the func_classes to fit
+    :param tuple param_values: the initial value and the lower bound of the parameters
+    :param bool log: if true the logarithm of the data is fitted
+    :param bool switch_axes: if true the axes will be inverted
+    :return list: the FitJobs
+    """
+    jobs = []
+    for func_class in func_classes:
+        for cell in cells:
+            for spike in range(1, range_spike + 1):
+                jobs.append(FitJob(cell_name=cell if isinstance(cell, str) else None, spike=spike,
+                                   func_class=func_class, param_values=param_values,
+                                   name_to_save=getattr(func_class, "__name__", str(func_class)), log=log,
+                                   switch_axes=switch_axes, do_all=cell is None,
+                                   chosen_cells=cell if isinstance(cell, list) else None))
+    return jobs
+
+
+def fit_job(payload: tuple) -> tuple:
+    """
+    Fits one spike like LMFit.minimize, this runs in the worker processes.
+    :param tuple payload: the func_class, the param_values, x, the data, the log flag and the MultiStart settings
+    or None
+    :return tuple: the result on plain arrays, the seconds of the fitting, the multi-start record or None, the
+    fitted values and the statistics
+    """
+    func_class, param_values, x, data, log, multi_start = payload
+    start = time.perf_counter()
+    record = None
+    if multi_start is not None and isinstance(func_class, Model):
+        result, record = multi_start_fit(model=func_class, param_values=param_values, x=x, data=data,
+                                         settings=multi_start)
+    else:
+        result, _ = minimize_function(func_class=func_class, param_values=param_values, x=x, data=data)
+    result = plain_result(result=result, param_values=param_values, n_params=func_class.n_params)
+    seconds = time.perf_counter() - start
+    return (result, seconds, record) + fit_statistics(func_class=func_class, result=result, x=x, data=data, log=log)
+
+
+def fit_statistics(func_class, result, x, data, log: bool) -> tuple:
+    """
+    :return tuple: the values of the fitted func_class at the points and the statistics of the fit
+    """
+    fitted = fitted_curve(func_class=func_class, result=result, x=x)
+    return fitted, diagnose(result=result, data=data, fitted=fitted, n_params=func_class.n_params, log=log)
+
+
+class BatchFitter:
+    """
+    Fits many cells, spikes and func_classes in a process pool.
+    The data is prepared and the results are saved in the main process, the workers only fit. The fittings go
+    through the fit cache, the multi-start settings and the instrumentation of the LMFit like its own fittings:
+    the saved fittings are not sent to the workers, and the new ones are saved, logged and recorded in the
+    order of the jobs.
+    """
+
+    def __init__(self, lm_fit: LMFit, max_workers: int = None, chunksize: int = 1) -> None:
+        """
+        :param LMFit lm_fit: the LMFit class, its coeff, func_dict and bad_fitting are filled
+        :param int max_workers: the number of the processes, 1 fits in the main process
+        :param int chunksize: the number of the jobs sent to a worker at once
+        """
+        self.lm_fit = lm_fit
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+
+    def fit(self, jobs: list) -> dict:
+        """
+        Runs the fittings, the results are saved in the order of the jobs.
+        :param list jobs: the FitJobs
+        :return dict: {(name_to_save, cell label): (df_n, df_params)} like create_lmfit_curve_fit's tables
+        """
+        lm_fit = self.lm_fit
+        axes, keys, outputs, payloads = [], [], [], []
+        for job in jobs:
+            x, data = lm_fit.data_class.define_axes(cell_name=job.cell_name, string=f"{job.spike}.spike",
+                                                    do_all=job.do_all, log=job.log, switch_axes=job.switch_axes,
+                                                    chosen_cells=job.chosen_cells)
+            key = lm_fit.cache_key(func_class=job.func_class, param_values=job.param_values, x=x, data=data,
+                                   flags={"log": job.log, "switch_axes": job.switch_axes})
+            start = time.perf_counter()
+            result = None if key is None else lm_fit.fit_cache.get(key=key, param_values=job.param_values)
+            axes.append((x, data))
+            keys.append(key)
+            if result is None:
+                outputs.append(None)
+                payloads.append((job.func_class, job.param_values, x, data, job.log, lm_fit.multi_start))
+            else:
+                seconds = time.perf_counter() - start
+                outputs.append((result, seconds, None) + fit_statistics(func_class=job.func_class, result=result,
+                                                                        x=x, data=data, log=job.log))
+
+        if self.max_workers == 1 or not payloads:
+            fits = iter(list(map(fit_job, payloads)))
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                fits = iter(list(executor.map(fit_job, payloads, chunksize=self.chunksize)))
+
+        rows_n, rows_params = {}, {}
+        for job, (x, data), key, output in zip(jobs, axes, keys, outputs):
+            cached = output is not None
+            result, seconds, record, fitted, statistics = output if cached else next(fits)
+            name = model_name(job.func_class)
+            if not cached and key is not None:
+                lm_fit.fit_cache.put(key=key, result=result, n_params=job.func_class.n_params)
+            if record is not None:
+                lm_fit.multi_start_log.append({"func_class": name, **record})
+            lm_fit.instrumentation.record_fit(function="batch_fit", model=job.name_to_save, cell=job.label,
+                                              spike=f"{job.spike}.spike", seconds=seconds, func_class=name,
+                                              n_points=len(data), nfev=result.nfev, success=bool(result.success),
+                                              message=str(result.message), warm=False, cached=cached,
+                                              chisqr=result.chisqr)
+            lm_fit.record_fit(name_to_save=job.name_to_save, cell_name=job.cell_name, spike=job.spike - 1,
+                              do_all=job.do_all, chosen_cells=job.chosen_cells, fitted=fitted,
+                              statistics=statistics)
+            table = (job.name_to_save, job.label)
+            rows_n.setdefault(table, {})[job.spike] = {f"a{i + 1}": result.values[i]
+                                                    for i in range(job.func_class.n_params)}
+            rows_params.setdefault(table, {})[job.spike] = {item: statistics.as_dict()[item] for item in
+                                                         ["p-value", "r_2", "adjusted_r_2", "RMSE", "aic", "bic",
+                                                          "squared_diff"]}
+        return {key: (pd.DataFrame.from_dict(rows_n[key], orient="index"),
+                      pd.DataFrame.from_dict(rows_params[key], orient="index")) for key in rows_n}
@@ -0,0 +1,161 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.lm_fit import LMFit, fit_values, minimize_function
+from src.models import Model
+
+
+def resample_indices(n_points: int, n_replicates: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draws the bootstrap samples of a spike at once.
+    :param int n_points: the number of the points
+    :param int n_replicates: the number of the samples
+    :param np.random.Generator rng: the random generator
+    :return np.ndarray: the positions of the points of every sample, shape (n_replicates, n_points)
+    """
+    return rng.integers(0, n_points, size=(n_replicates, n_points))
+
+
+def linear_replicates(model: Model, param_values: tuple, x: np.ndarray, data: np.ndarray,
+                      indices: np.ndarray) -> tuple:
+    """
+    Solves the least squares problems of the samples of a linear model at once from their normal equations.
+    :param Model model: the linear model
+    :param tuple param_values: the initial value and the lower bound of the parameters
+    :param np.ndarray x: the independent variable
+    :param np.ndarray data: the data
+    :param np.ndarray indices: the positions of the points of every sample
+    :return tuple: the parameters of every sample and true where they are the bounded least squares solution,
+    the others (a parameter under the lower bound or a singular sample) have to be fitted iteratively
+    """
+    design = model.jacobian(p=np.full(model.n_params, param_values[0], dtype=float), x=x)[indices]
+    gram = np.einsum("rni,rnj->rij", design, design)
+    moment = np.einsum("rni,rn->ri", design, data[indices])
+    with np.errstate(all="ignore"):
+        solvable = np.linalg.cond(gram) < 1e12
+    values = np.full(moment.shape, np.nan)
+    if solvable.any():
+        values[solvable] = np.linalg.solve(gram[solvable], moment[solvable][..., None])[..., 0]
+    return values, solvable & np.all(values >= param_values[1], axis=1)
+
+
+def bootstrap_job(payload: tuple) -> np.ndarray:
+    """
+    Fits the bootstrap samples of a spike, every fit starts from the parameters of the original fit.
+    The samples of a linear model are solved at once, only the singular ones and the ones that hit the bounds are
+    fitted one by one.
+    This runs in the worker processes.
+    :param tuple payload: the func_class, the param_values, x, the data, the resampled positions and the
+    original parameters
+    :return np.ndarray: the parameters of every sample, NaN where the fit did not converge
+    """
+    func_class, param_values, x, data, indices, init_values = payload
+    values = np.full((len(indices), func_class.n_params), np.nan)
+    remaining = np.arange(len(indices))
+    if getattr(func_class, "linear", False):
+        solved, exact = linear_replicates(model=func_class, param_values=param_values, x=x, data=data,
+                                          indices=indices)
+        values[exact] = solved[exact]
+        remaining = np.flatnonzero(~exact)
+    # the samples of a small spike repeat often, a sample is fitted once whatever the order of its points
+    fitted = {}
+    for row in remaining:
+        positions = np.sort(indices[row])
+        key = positions.tobytes()
+        if key not in fitted:
+            result, chi_sqr = minimize_function(func_class=func_class, param_values=param_values, x=x[positions],
+                                                data=data[positions], init_values=init_values)
+            fitted[key] = fit_values(result=result, n_params=func_class.n_params) \
+                if result.success and np.isfinite(chi_sqr) else np.nan
+        values[row] = fitted[key]
+    return values
+
+
+def percentile_intervals(estimates: np.ndarray, replicates: np.ndarray, alpha: float) -> dict:
+    """
+    :param np.ndarray estimates: the parameters of the original fit
+    :param np.ndarray replicates: the parameters of the bootstrap samples, shape (n_replicates, n_params)
+    :param float alpha: the significance level
+    :return dict: the estimate, the percentile interval, the standard error and the number of the converged
+    samples of every parameter, as columns
+    """
+    converged = np.isfinite(replicates).all(axis=1)
+    good = replicates[converged]
+    if len(good):
+        lower, upper = np.percentile(good, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+        std = good.std(axis=0, ddof=1) if len(good) > 1 else np.full(len(estimates), np.nan)
+    else:
+        lower = upper = std = np.full(len(estimates), np.nan)
+    return {"parameter": [f"a{i + 1}" for i in range(len(estimates))], "estimate": estimates, "lower": lower,
+            "upper": upper, "std": std, "n_converged": int(converged.sum())}
+
+
+class Bootstrap:
+    """
+    Computes percentile confidence intervals of the fitted parameters by resampling the points of the spikes.
+    The samples of a spike are drawn once and split into chunks that are fitted in a process pool, the data is
+    prepared in the main process like in BatchFitter. The samples only depend on the seed and the jobs, not on
+    the number of the processes.
+    """
+
+    def __init__(self, lm_fit: LMFit, n_replicates: int = 1000, seed: int = 0, alpha: float = 0.05,
+                 max_workers: int = None, chunk_size: int = 100) -> None:
+        """
+        :param LMFit lm_fit: the original fits go through its fit cache
+        :param int n_replicates: the number of the bootstrap samples of a spike
+        :param int seed: the seed of the samples
+        :param float alpha: the significance level, the intervals are between the alpha / 2 and 1 - alpha / 2
+        percentiles
+        :param int max_workers: the number of the processes, 1 fits in the main process
+        :param int chunk_size: the number of the samples fitted in a task
+        """
+        self.lm_fit = lm_fit
+        self.n_replicates = n_replicates
+        self.seed = seed
+        self.alpha = alpha
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.replicates = {}
+
+    def run(self, jobs: list) -> pd.DataFrame:
+        """
+        :param list jobs: the FitJobs, see batch_fit.make_jobs
+        :return pd.DataFrame: one row for every parameter of every job, with the estimate and its interval
+        """
+        seeds = np.random.SeedSequence(self.seed).spawn(len(jobs))
+        payloads, owners, estimates = [], [], []
+        for number, (job, seed) in enumerate(zip(jobs, seeds)):
+            x, data = self.lm_fit.data_class.define_axes(cell_name=job.cell_name, string=f"{job.spike}.spike",
+                                                         do_all=job.do_all, log=job.log,
+                                                         switch_axes=job.switch_axes, chosen_cells=job.chosen_cells)
+            x, data = np.asarray(x, dtype=float), np.asarray(data, dtype=float)
+            result, _ = self.lm_fit.fit_the_function(func_class=job.func_class, param_values=job.param_values,
+                                                     x=x, data=data, flags={"log": job.log,
+                                                                            "switch_axes": job.switch_axes})
+            estimates.append(fit_values(result=result, n_params=job.func_class.n_params))
+            if len(data) < job.func_class.n_params:
+                continue
+            indices = resample_indices(n_points=len(data), n_replicates=self.n_replicates,
+                                       rng=np.random.default_rng(seed))
+            for start in range(0, self.n_replicates, self.chunk_size):
+                payloads.append((job.func_class, job.param_values, x, data, indices[start:start + self.chunk_size],
+                                 estimates[-1]))
+                owners.append(number)
+
+        if self.max_workers == 1:
+            outputs = list(map(bootstrap_job, payloads))
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                outputs = list(executor.map(bootstrap_job, payloads))
+
+        rows = []
+        for number, job in enumerate(jobs):
+            parts = [output for owner, output in zip(owners, outputs) if owner == number]
+            replicates = np.concatenate(parts) if parts else np.empty((0, job.func_class.n_params))
+            self.replicates[(job.name_to_save, job.label, job.spike)] = replicates
+            intervals = percentile_intervals(estimates=estimates[number], replicates=replicates, alpha=self.alpha)
+            rows.append(pd.DataFrame({"name_to_save": job.name_to_save, "cell": job.label,
+                                      "spike": f"{job.spike}.spike", **intervals}))
+        return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
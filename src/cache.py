@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A bounded memoization layer, the least recently used item is evicted first.
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        """
+        :param int maxsize: the maximal number of the stored items, 0 switches the caching off
+        """
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """
+        Gives the stored item of the key or builds and stores it.
+        :param key: a hashable key
+        :param build: a function without arguments that creates the item
+        :return: the item
+        """
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+        self.misses += 1
+        item = build()
+        if self.maxsize > 0:
+            self.items[key] = item
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return item
+
+    def clear(self) -> None:
+        """
+        Removes every item and resets the counters.
+        """
+        self.items.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> dict:
+        """
+        :return dict: the number of hits, misses and stored items
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.items), "maxsize": self.maxsize}
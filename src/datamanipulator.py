@@ -1,181 +1,271 @@
-import math
 import pandas as pd
 import numpy as np
 
+from src.cache import LRUCache
+from src.spike_store import CellView, SpikeStore, SpikeView
+
+
+def add_points(gbz_dict: dict, writing: str, times: np.ndarray, ifs: np.ndarray) -> None:
+    """
+    Adds the points to the given spike of the dictionary.
+    :param dict gbz_dict: the dictionary of the spikes
+    :param str writing: the number of the spike, for example "1.spike"
+    :param np.ndarray times: the relative firing times
+    :param np.ndarray ifs: the IF values
+    """
+    if writing not in gbz_dict:
+        gbz_dict[writing] = {"relative firing time": times, "IF": ifs}
+    else:
+        gbz_dict[writing] = {
+            "relative firing time": np.concatenate((gbz_dict[writing]["relative firing time"], times)),
+            "IF": np.concatenate((gbz_dict[writing]["IF"], ifs))}
+
+
+def descending_order(values: np.ndarray) -> np.ndarray:
+    """
+    Sorts like DataFrame.sort_values(ascending=False): equal values keep their order, NaN values go last.
+    :param np.ndarray values: the values to sort
+    :return np.ndarray: the positions of the values in descending order
+    """
+    order = len(values) - 1 - np.argsort(values[::-1], kind="stable")[::-1]
+    nan = np.isnan(values[order])
+    return np.concatenate((order[~nan], np.flatnonzero(np.isnan(values))))
+
+
+def fit_axes(times: np.ndarray, ifs: np.ndarray, log: bool, switch_axes: bool) -> tuple:
+    """
+    Sorts the points of a spike by relative firing time, descending, into the arrays to fit.
+    :param np.ndarray times: the relative firing times
+    :param np.ndarray ifs: the IF values
+    :param bool log: if true the logarithm of the values is given
+    :param bool switch_axes: if true IF is the independent variable
+    :return tuple: x and the data, new arrays
+    """
+    order = descending_order(values=times)
+    if switch_axes:
+        x, data = ifs[order], times[order]
+    else:
+        x, data = times[order], ifs[order]
+    if log:
+        x, data = np.log10(x), np.log10(data)
+    return x, data
+
+
+def measure_matrix(times: np.ndarray, ifs: np.ndarray) -> tuple:
+    """
+    Counts the points of the measurements of many cells at once, like DataManipulator.measurements.
+    A measurement ends where the relative firing time does not increase, the points before a NaN time are skipped,
+    and a measurement restarts from its current point where the time increases at a point with an IF value.
+    :param np.ndarray times: the relative firing times, one column for every cell
+    :param np.ndarray ifs: the IF values, one column for every cell
+    :return tuple: the number of the points of every measurement (cells x measurements, 0 after the last one)
+    and the number of the measurements of every cell
+    """
+    n_rows, n_cells = times.shape
+    if n_rows < 2 or np.isnan(times[1:]).all():
+        return np.zeros((n_cells, 0), dtype=np.int64), np.zeros(n_cells, dtype=np.int64)
+    # the point idx belongs to a measurement if the time at idx + 1 is known
+    assigned = ~np.isnan(times[1:])
+    with np.errstate(invalid="ignore"):
+        increasing = times[:-1] < times[1:]
+    ends = assigned & ~increasing
+    resets = assigned & increasing & ~np.isnan(ifs[:-1])
+    measure = np.cumsum(ends, axis=0) - ends
+    segment = np.cumsum(resets, axis=0)
+    n_measures = ends.sum(axis=0) + (assigned & (measure == ends.sum(axis=0))).any(axis=0)
+
+    # the assigned points in column order, grouped by cell then by measurement
+    cells, rows = np.nonzero(assigned.T)
+    keys = cells * n_rows + measure[rows, cells]
+    segment = segment[rows, cells]
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    last = np.append(bounds, len(keys)) - 1
+    group = np.repeat(np.arange(len(last)), np.diff(np.concatenate(([0], last + 1))))
+    # only the points after the last restart of a measurement are counted
+    counted = np.bincount(group, weights=segment == segment[last][group], minlength=len(last)).astype(np.int64)
+
+    counts = np.zeros((n_cells, int(n_measures.max())), dtype=np.int64)
+    counts[keys[last] // n_rows, keys[last] % n_rows] = counted
+    return counts, n_measures.astype(np.int64)
+
+
+def measure_counts(times: np.ndarray, ifs: np.ndarray) -> list:
+    """
+    Counts the points of the measurements of a cell, see measure_matrix.
+    :param np.ndarray times: the relative firing times of the cell
+    :param np.ndarray ifs: the IF values of the cell
+    :return list: the number of the points of every measurement
+    """
+    counts, n_measures = measure_matrix(times=np.asarray(times, dtype=float)[:, None],
+                                        ifs=np.asarray(ifs, dtype=float)[:, None])
+    return counts[0, :n_measures[0]].tolist()
+
 
 class DataManipulator:
     """
     A class to manage data manipulations.
     """
 
-    def __init__(self, data):
+    def __init__(self, data, cache_size: int = 128):
         """
         :param data: The original dataframe.
-        The dictionary look like this:
+        :param int cache_size: the number of the sorted frames kept in memory, 0 switches the caching off
+        The points are kept in a SpikeStore, the dictionaries are read-only views of it and look like this:
         {"the name of the cells":{"the number of the spike":{"relative firing-time:[], "IF":[]}}}
         """
         self.data = data
         self.names = [x[0] for x in self.data.columns][::2]
-        self.dict = {}
-        self.all_in_one_dict = {}
+        self.store = SpikeStore.from_frame(data=self.data, names=self.names)
+        self.dict = CellView(store=self.store)
+        self.all_in_one_dict = SpikeView(store=self.store)
         self.choose_cells = {}
-        self.__create_dict()
+        self.chosen_cache = LRUCache(maxsize=min(cache_size, 16))
+        self.frame_cache = LRUCache(maxsize=cache_size)
+        self.measure_cache = None
 
     def all_in_one_dict_creating(self, gbz_dict, chosen_cells: list) -> dict:
-        spike = 1
-        for name in chosen_cells:
-            for idx in range(0, len(self.data[name]["IF"])):
-                if math.isnan(self.data[name]["IF"][idx]) is True:
-                    spike = 1
-                else:
-                    writing = f"{spike}.spike"
-                    if writing not in gbz_dict:
-                        gbz_dict[writing] = {"relative firing time": [], "IF": []}
-                    gbz_dict[writing]["relative firing time"].append(self.data[name]["relative firing time"][idx])
-                    gbz_dict[writing]["IF"].append(self.data[name]["IF"][idx])
-                    spike += 1
+        """
+        Pools the spikes of the chosen cells into one dictionary.
+        :param dict gbz_dict: the dictionary to fill, the already existing spikes are extended
+        :param list chosen_cells: the names of the cells
+        :return dict: {"the number of the spike": {"relative firing time": [], "IF": []}}
+        """
+        for writing, points in self.chosen_cells_dict(chosen_cells=chosen_cells).items():
+            add_points(gbz_dict=gbz_dict, writing=writing, times=points["relative firing time"], ifs=points["IF"])
         return gbz_dict
 
     def create_cell_dict(self, gbz_dict) -> dict:
-        spike = 1
-        for name in [x[0] for x in self.data.columns][::2]:
-            gbz_dict[name] = {}
-            for idx in range(0, len(self.data[name]["IF"])):
-                if math.isnan(self.data[name]["IF"][idx]) is True:
-                    spike = 1
-                else:
-                    writing = f"{spike}.spike"
-                    if writing not in gbz_dict[name]:
-                        gbz_dict[name][writing] = {"relative firing time": [], "IF": []}
-                    gbz_dict[name][writing]["relative firing time"].append(
-                        self.data[name]["relative firing time"][idx])
-                    gbz_dict[name][writing]["IF"].append(self.data[name]["IF"][idx])
-                    spike += 1
+        """
+        Copies the spikes of every cell into the given dictionary.
+        :param dict gbz_dict: the dictionary to fill
+        :return dict: {"the name of the cell": {"the number of the spike": {"relative firing time": [], "IF": []}}}
+        """
+        for name in self.names:
+            gbz_dict[name] = dict(self.dict[name])
         return gbz_dict
 
-    def __create_dict(self) -> None:
+    def chosen_cells_dict(self, chosen_cells: list) -> SpikeView:
         """
-        This method creates a dictionary from the data.
-        :return None
+        Pools the spikes of the chosen cells, the numbering of the spikes runs over their columns in the given order.
+        :param list chosen_cells: the names of the cells
+        :return SpikeView: {"the number of the spike": {"relative firing time": [], "IF": []}}
         """
-        self.all_in_one_dict_creating(gbz_dict=self.all_in_one_dict, chosen_cells=self.names)
-        self.create_cell_dict(gbz_dict=self.dict)
+        cells = tuple(chosen_cells)
+        self.choose_cells = self.chosen_cache.get(
+            key=cells, build=lambda: SpikeView(store=SpikeStore.from_frame(data=self.data, names=list(cells))))
+        return self.choose_cells
 
-    def create_frame(self, cell_name: str, spike: str, y: bool, do_all: bool, chosen_cells) -> pd.DataFrame:
+    @staticmethod
+    def cells_key(cell_name: str, do_all: bool, chosen_cells) -> tuple:
         """
-        This method creates a Dataframe from a cell's spike's relative firing time and IF.
-        :param chosen_cells:
+        Gives the part of the cache keys that identifies the used cells.
+        The chosen cells are kept in order, because the numbering of the spikes runs over their columns.
         :param str cell_name: the name of the brain cell
-        :param str spike: the number of the spike, for example "1.spike"
-        :param bool y: if true the axes will be reversed
-        :param bool do_all: if true the common dict from all cells will be used.
-        :return pd.DataFrame: the created dataframe
+        :param bool do_all: if true the points of all cells are used
+        :param chosen_cells: if it is a list, the points of these cells are used
+        :return tuple: the key
         """
         if do_all:
-            if not y:
-                df = pd.DataFrame.from_dict(self.all_in_one_dict[spike])
-                df.sort_values(by="relative firing time", ascending=False, inplace=True)
-                return df
-            else:
-                df = pd.DataFrame.from_dict(self.all_in_one_dict[spike])
-                df.sort_values(by="IF", ascending=False, inplace=True)
-                return df
+            return ("all",)
         elif isinstance(chosen_cells, list):
-            self.choose_cells = {}
-            if not y:
-                dictionary = self.all_in_one_dict_creating(gbz_dict=self.choose_cells, chosen_cells=chosen_cells)
-                df = pd.DataFrame.from_dict(dictionary[spike])
-                df.sort_values(by="relative firing time", ascending=False, inplace=True)
-                df.reset_index()
-                return df
-            else:
-                dictionary = self.all_in_one_dict_creating(gbz_dict=self.choose_cells, chosen_cells=chosen_cells)
-                df = pd.DataFrame.from_dict(dictionary[spike])
-                df.sort_values(by="IF", ascending=False, inplace=True)
-                df = df.reset_index(inplace=True)
-                return df
-        else:
-            if not y:
-                df = pd.DataFrame.from_dict(self.dict[cell_name][spike])
-                df.sort_values(by="relative firing time", ascending=False, inplace=True)
-                return df
-            else:
-                df = pd.DataFrame.from_dict(self.dict[cell_name][spike])
-                df.sort_values(by="IF", ascending=False, inplace=True)
-                return df
+            return ("chosen", tuple(chosen_cells))
+        return ("cell", cell_name)
 
-    def define_axes(self, cell_name, string, do_all, log, switch_axes, chosen_cells):
+    def cache_info(self) -> dict:
+        """
+        :return dict: the hits, misses and sizes of the chosen cells' and the sorted frames' caches
+        """
+        return {"chosen_cells": self.chosen_cache.info(), "frames": self.frame_cache.info()}
+
+    def clear_cache(self) -> None:
+        """
+        Empties the caches.
+        """
+        self.chosen_cache.clear()
+        self.frame_cache.clear()
+        self.measure_cache = None
+
+    def spike_points(self, cell_name: str, spike: str, do_all: bool, chosen_cells) -> tuple:
+        """
+        Gives the points of a spike without copying them.
+        :param str cell_name: the name of the brain cell
+        :param str spike: the number of the spike, for example "1.spike"
+        :param bool do_all: if true the points of all cells will be used
+        :param chosen_cells: if it is a list, the points of these cells will be used
+        :return tuple: the relative firing times and the IF values
+        """
         if do_all:
-            df = self.create_frame(cell_name=cell_name, spike=string, y=False, do_all=do_all, chosen_cells=chosen_cells)
+            points = self.all_in_one_dict[spike]
         elif isinstance(chosen_cells, list):
-            df = self.create_frame(cell_name=cell_name, spike=string, y=False, do_all=do_all, chosen_cells=chosen_cells)
-        else:
-            df = self.create_frame(cell_name=cell_name, spike=string, y=False, do_all=do_all, chosen_cells=chosen_cells)
-
-        if log:
-            if switch_axes:
-                data = np.log10(df["relative firing time"])
-                x = np.log10(df["IF"])
-            else:
-                x = np.log10(df["relative firing time"])
-                data = np.log10(df["IF"])
+            points = self.chosen_cells_dict(chosen_cells=chosen_cells)[spike]
         else:
-            if switch_axes:
-                data = np.array(df["relative firing time"])
-                x = np.array(df["IF"])
-            else:
-                x = np.array(df["relative firing time"])
-                data = np.array(df["IF"])
-        return x, data
+            points = self.dict[cell_name][spike]
+        return points["relative firing time"], points["IF"]
+
+    def create_frame(self, cell_name: str, spike: str, y: bool, do_all: bool, chosen_cells) -> pd.DataFrame:
+        """
+        This method creates a Dataframe from a cell's spike's relative firing time and IF.
+        :param chosen_cells: if it is a list, the points of these cells will be used
+        :param str cell_name: the name of the brain cell
+        :param str spike: the number of the spike, for example "1.spike"
+        :param bool y: if true the frame is sorted by IF, otherwise by relative firing time
+        :param bool do_all: if true the common dict from all cells will be used.
+        :return pd.DataFrame: the created dataframe, indexed by the position of the points in the spike
+        """
+        def build():
+            times, ifs = self.spike_points(cell_name=cell_name, spike=spike, do_all=do_all,
+                                           chosen_cells=chosen_cells)
+            order = descending_order(values=ifs if y else times)
+            return pd.DataFrame({"relative firing time": times[order], "IF": ifs[order]}, index=order)
+
+        key = ("frame", self.cells_key(cell_name=cell_name, do_all=do_all, chosen_cells=chosen_cells), spike, y)
+        return self.frame_cache.get(key=key, build=build).copy()
+
+    def define_axes(self, cell_name, string, do_all, log, switch_axes, chosen_cells):
+        """
+        Gives the points of a spike sorted by relative firing time as the arrays to fit.
+        :param str cell_name: the name of the brain cell
+        :param str string: the number of the spike, for example "1.spike"
+        :param bool do_all: if true the points of all cells will be used
+        :param bool log: if true the logarithm of the values is given
+        :param bool switch_axes: if true IF is the independent variable
+        :param chosen_cells: if it is a list, the points of these cells will be used
+        :return tuple: x and the data, read-only arrays shared with the cache
+        """
+        def build():
+            times, ifs = self.spike_points(cell_name=cell_name, spike=string, do_all=do_all,
+                                           chosen_cells=chosen_cells)
+            x, data = fit_axes(times=times, ifs=ifs, log=log, switch_axes=switch_axes)
+            x.flags.writeable = False
+            data.flags.writeable = False
+            return x, data
+
+        key = ("axes", self.cells_key(cell_name=cell_name, do_all=do_all, chosen_cells=chosen_cells), string,
+               switch_axes, log)
+        return self.frame_cache.get(key=key, build=build)
+
+    def measure_count_matrix(self) -> tuple:
+        """
+        Counts the points of the measurements of every cell, the result is kept until clear_cache is called.
+        :return tuple: the counts (cells x measurements) and the number of the measurements of every cell,
+        see measure_matrix
+        """
+        if self.measure_cache is None:
+            times = self.data.xs("relative firing time", axis=1, level=1)[self.names].to_numpy(dtype=float)
+            ifs = self.data.xs("IF", axis=1, level=1)[self.names].to_numpy(dtype=float)
+            self.measure_cache = measure_matrix(times=times, ifs=ifs)
+        return self.measure_cache
 
     def measurements(self) -> pd.DataFrame:
         """
         Creates the measurement dataframe, that counts the number of the measurements in every spike of a cell.
         :return pd.DataFrame: the dataframe
         """
-        measure_dict = {}
-        for name in [x[0] for x in self.data.columns][::2]:
-            measure_dict[name] = {}
-            measure = 1
-            for idx in range(0, len(self.data[name]["relative firing time"])):
-                if idx == len(self.data[name]["relative firing time"]) - 1:
-                    continue
-                else:
-                    if math.isnan(self.data[name]["relative firing time"][idx + 1]) is True:
-                        continue
-                    elif self.data[name]["relative firing time"][idx] < self.data[name]["relative firing time"][idx + 1]:
-                        writing = f"{measure}.measure"
-                        if writing not in measure_dict[name]:
-                            measure_dict[name][writing] = {"relative firing time": [], "IF": []}
-                        if math.isnan(self.data[name]["IF"][idx]) is False:
-                            measure_dict[name][writing] = {"relative firing time": [], "IF": []}
-                            measure_dict[name][writing]["relative firing time"].append(
-                                self.data[name]["relative firing time"][idx])
-                            measure_dict[name][writing]["IF"].append(self.data[name]["IF"][idx])
-                        else:
-                            measure_dict[name][writing]["relative firing time"].append(
-                                self.data[name]["relative firing time"][idx])
-                    else:
-                        writing = f"{measure}.measure"
-                        if writing not in measure_dict[name]:
-                            measure_dict[name][writing] = {"relative firing time": [], "IF": []}
-                        if math.isnan(self.data[name]["IF"][idx]) is False:
-                            measure_dict[name][writing]["relative firing time"].append(
-                                self.data[name]["relative firing time"][idx])
-                            measure_dict[name][writing]["IF"].append(self.data[name]["IF"][idx])
-                        else:
-                            measure_dict[name][writing]["relative firing time"].append(
-                                self.data[name]["relative firing time"][idx])
-                        measure += 1
-
-        n_dict = {}
-        for name in [x[0] for x in self.data.columns][::2]:
-            n_dict[name] = {}
-            for spike in range(1, len(measure_dict[name]) + 1):
-                writing = f"{spike}.measure"
-                n_dict[name][writing] = len(measure_dict[name][writing]["relative firing time"])
-
-        return pd.DataFrame(n_dict).transpose().fillna(0)
+        counts, n_measures = self.measure_count_matrix()
+        # like the dataframe of the dictionaries of the cells, the values are float if a cell has fewer measurements
+        dtype = np.int64 if len(n_measures) and n_measures.min() == counts.shape[1] else float
+        return pd.DataFrame(counts.astype(dtype), index=self.names,
+                            columns=[f"{idx + 1}.measure" for idx in range(counts.shape[1])])
 
     def create_spike_frame(self) -> pd.DataFrame:
         """
@@ -183,9 +273,7 @@ class DataManipulator:
         :return pd.DataFrame: the created dataframe
         """
         n_dict = {}
-        for name in [x[0] for x in self.data.columns][::2]:
-            n_dict[name] = {}
-            for spike in range(1, len(self.dict[name]) + 1):
-                writing = f"{spike}.spike"
-                n_dict[name][writing] = len(self.dict[name][writing]["relative firing time"])
+        for cell, name in enumerate(self.names):
+            n_dict[name] = {f"{spike}.spike": self.store.counts[spike - 1, cell]
+                            for spike in self.store.spikes_of(cell_name=name)}
         return pd.DataFrame(n_dict).transpose().fillna(0)
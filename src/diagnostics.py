@@ -0,0 +1,81 @@
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class FitDiagnostics:
+    """
+    The goodness of fit of one fitting.
+    """
+    n_points: int
+    n_params: int
+    nfree: int
+    chisqr: float
+    aic: float
+    bic: float
+    p_value: float
+    squared_diff: float
+    r_2: float
+    adjusted_r_2: float
+    rmse: float
+
+    def as_dict(self) -> dict:
+        """
+        :return dict: the statistics with the keys of LMFit.coeff
+        """
+        return {"aic": self.aic, "bic": self.bic, "p-value": self.p_value, "squared_diff": self.squared_diff,
+                "r_2": self.r_2, "adjusted_r_2": self.adjusted_r_2, "RMSE": self.rmse}
+
+    @property
+    def bad(self) -> bool:
+        """
+        :return bool: true if the fitting goes to LMFit.bad_fitting
+        """
+        return bool(self.p_value < 0.05 and self.r_2 < 0.6)
+
+
+def diagnose(result, data, fitted, n_params: int, log: bool) -> FitDiagnostics:
+    """
+    Computes every statistic of a fitting from the model values evaluated once.
+    r_2 is computed like sklearn's r2_score, 1 for a perfect fit of constant data and 0 for an imperfect one.
+    :param result: the result of the minimization, with aic, bic, chisqr and nfree
+    :param data: the fitted data
+    :param fitted: the values of the fitted function at the points
+    :param int n_params: the number of the parameters
+    :param bool log: if true the data is the logarithm of the values, the squared_diff is computed on the values
+    :return FitDiagnostics: the statistics
+    """
+    from scipy import stats
+
+    data = np.asarray(data, dtype=float)
+    fitted = np.asarray(fitted, dtype=float)
+    n = len(data)
+    residual = data - fitted
+    ss_res = residual @ residual
+    centered = data - data.mean()
+    ss_tot = centered @ centered
+    if log:
+        squared_difference = np.sum((10 ** data - 10 ** fitted) ** 2 / n)
+    else:
+        squared_difference = np.sum(residual ** 2 / n)
+    if ss_tot != 0:
+        r_2 = 1 - ss_res / ss_tot
+    else:
+        r_2 = 1.0 if ss_res == 0 else 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        adjusted_r_2 = 1 - (1 - r_2) * np.float64(n - 1) / (n - n_params - 1)
+    return FitDiagnostics(n_points=n, n_params=n_params, nfree=result.nfree, chisqr=result.chisqr, aic=result.aic,
+                          bic=result.bic, p_value=1 - stats.chi2.cdf(result.chisqr, result.nfree),
+                          squared_diff=squared_difference, r_2=r_2, adjusted_r_2=adjusted_r_2,
+                          rmse=np.sqrt(ss_res / n))
+
+
+def diagnostics_frame(rows: list) -> pd.DataFrame:
+    """
+    Creates a columnar table from the diagnostics.
+    :param list rows: (dict of the identifying columns, FitDiagnostics) pairs
+    :return pd.DataFrame: one row for every fitting
+    """
+    return pd.DataFrame([{**keys, **asdict(record)} for keys, record in rows])
@@ -1,30 +1,440 @@
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, NamedTuple
 
-import requests
+import numpy as np
 import pandas as pd
 
 from src import PROJECT_PATH
 
+if TYPE_CHECKING:
+    import requests
+
+
+def file_hash(file: str) -> str:
+    """
+    :param str file: the path of the file
+    :return str: the sha256 hash of the file
+    """
+    digest = hashlib.sha256()
+    with open(file, "rb") as in_file:
+        for chunk in iter(lambda: in_file.read(1024 ** 2), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+GDRIVE_LINK = "https://drive.google.com/uc?export=download&id="
+CHUNK_SIZE = 1024 ** 2
+
+_session = None
+
+
+def get_session() -> "requests.Session":
+    """
+    :return requests.Session: the session shared by the downloads, so the connections are reused
+    """
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
+
+def make_session(pool_size: int = 10) -> "requests.Session":
+    """
+    :param int pool_size: the number of the connections kept open to a host
+    :return requests.Session: a session with a connection pool for concurrent downloads
+    """
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def data_folder() -> str:
+    """
+    Creates the data and generated folders of the project.
+    :return str: the path of the data folder
+    """
+    os.makedirs(os.path.join(PROJECT_PATH, "generated"), exist_ok=True)
+    folder = os.path.join(PROJECT_PATH, "data")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def fetch_file(file: str, url: str, sha256: str = None, session: "requests.Session" = None, retries: int = 3,
+               timeout: float = 30) -> bool:
+    """
+    Downloads the file if it is missing or its hash is not the expected one.
+    :param str file: the path to save the file to
+    :param str url: the address of the file
+    :param str sha256: the expected sha256 hash of the file, not checked if None
+    :param requests.Session session: the session of the requests, by default the shared one
+    :param int retries: the number of the repeated attempts after a failed download
+    :param float timeout: the timeout of the connection and of the reading in seconds
+    :return bool: true if the file was downloaded
+    """
+    if os.path.isfile(file) and (sha256 is None or file_hash(file=file) == sha256.lower()):
+        return False
+    download_file(url=url, file=file, sha256=sha256, session=session, retries=retries, timeout=timeout)
+    return True
+
+
+def download_file(url: str, file: str, sha256: str = None, session: "requests.Session" = None, retries: int = 3,
+                  backoff: float = 0.5, timeout: float = 30, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    Streams the file in chunks to file.part and renames it to file when it is complete.
+    An interrupted transfer is continued from the end of file.part with a Range request.
+    :param str url: the address of the file
+    :param str file: the path to save the file to
+    :param str sha256: the expected sha256 hash of the file, not checked if None
+    :param requests.Session session: the session of the requests, by default the shared one
+    :param int retries: the number of the repeated attempts after a failed one
+    :param float backoff: the waiting time before the first repeated attempt, doubled after every attempt
+    :param float timeout: the timeout of the connection and of the reading in seconds
+    :param int chunk_size: the size of the chunks written at once
+    :return str: the path of the file
+    """
+    import requests
+
+    session = session if session is not None else get_session()
+    part = f"{file}.part"
+    for attempt in range(retries + 1):
+        try:
+            stream_to_part(url=url, part=part, session=session, timeout=timeout, chunk_size=chunk_size)
+            break
+        except (requests.RequestException, IOError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+    if sha256 is not None and file_hash(file=part) != sha256.lower():
+        os.remove(part)
+        raise ValueError(f"The sha256 hash of {url} does not match {sha256}.")
+    os.replace(part, file)
+    return file
+
+
+def stream_to_part(url: str, part: str, session: "requests.Session", timeout: float, chunk_size: int) -> None:
+    """
+    Continues the download of the file from the size of the partial file.
+    :param str url: the address of the file
+    :param str part: the path of the partial file
+    :param requests.Session session: the session of the requests
+    :param float timeout: the timeout of the connection and of the reading in seconds
+    :param int chunk_size: the size of the chunks written at once
+    """
+    offset = os.path.getsize(part) if os.path.isfile(part) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with session.get(url, headers=headers, stream=True, timeout=timeout, allow_redirects=True) as r:
+        if r.status_code == 416:
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            if total.isdigit() and int(total) == offset:
+                return
+            os.remove(part)
+            raise IOError(f"The partial download of {url} is not valid.")
+        r.raise_for_status()
+        if r.status_code != 206:
+            offset = 0
+        length = r.headers.get("Content-Length")
+        expected = offset + int(length) if length is not None and "Content-Encoding" not in r.headers else None
+        with open(part, "ab" if offset else "wb") as out_file:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                out_file.write(chunk)
+    if expected is not None and os.path.getsize(part) != expected:
+        raise IOError(f"The download of {url} stopped at {os.path.getsize(part)} of {expected} bytes.")
+
+
+def cache_paths(file: str) -> tuple:
+    """
+    :param str file: the path of the Excel file
+    :return tuple: the paths of the binary data and of its description next to the file
+    """
+    return f"{file}.npy", f"{file}.json"
+
+
+def write_excel_cache(file: str, data: pd.DataFrame) -> bool:
+    """
+    Saves the values of the dataframe as one column-major float array, so every column is contiguous.
+    :param str file: the path of the Excel file
+    :param pd.DataFrame data: the parsed dataframe
+    :return bool: false if the data is not numeric and can not be cached
+    """
+    try:
+        values = np.asfortranarray(data.to_numpy(dtype=float))
+    except (TypeError, ValueError):
+        return False
+    array_file, _ = cache_paths(file=file)
+    np.save(f"{array_file}.tmp.npy", values)
+    os.replace(f"{array_file}.tmp.npy", array_file)
+    write_cache_description(file=file, columns=[list(column) for column in data.columns], shape=values.shape)
+    return True
+
+
+def replace_json(file: str, content: dict) -> None:
+    """
+    Writes the JSON file through a temporary file, so a reader never sees it half written.
+    :param str file: the path of the JSON file
+    :param dict content: the content
+    """
+    temporary = f"{file}.{os.getpid()}.tmp"
+    with open(temporary, "w") as out_file:
+        json.dump(content, out_file)
+    os.replace(temporary, file)
+
+
+def write_cache_description(file: str, columns: list, shape: tuple) -> None:
+    """
+    Saves the columns of the cached array and the signature of the Excel file it was made from.
+    :param str file: the path of the Excel file
+    :param list columns: the two-level names of the columns
+    :param tuple shape: the shape of the array
+    """
+    _, meta_file = cache_paths(file=file)
+    stat = os.stat(file)
+    meta = {"columns": columns, "shape": list(shape),
+            "source": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(file=file)}}
+    replace_json(file=meta_file, content=meta)
+
+
+def stream_excel_cache(file: str) -> bool:
+    """
+    Converts the first sheet of the Excel file to the binary cache row by row, without loading the whole sheet.
+    The first two rows are the header, an empty name in the first row continues the previous one like a merged cell.
+    :param str file: the path of the Excel file
+    :return bool: false if the data is not numeric and can not be cached
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        top, bottom = next(rows), next(rows)
+        columns, previous = [], None
+        for j, (first, second) in enumerate(zip(top, bottom)):
+            previous = first if first is not None else previous
+            columns.append([previous if previous is not None else f"Unnamed: {j}_level_0",
+                            second if second is not None else f"Unnamed: {j}_level_1"])
+        n_rows = 0
+        for idx, row in enumerate(rows):
+            if any(value is not None for value in row):
+                n_rows = idx + 1
+
+        array_file, _ = cache_paths(file=file)
+        values = np.lib.format.open_memmap(f"{array_file}.tmp.npy", mode="w+", dtype=float,
+                                           shape=(n_rows, len(columns)), fortran_order=True)
+        try:
+            for idx, row in enumerate(sheet.iter_rows(min_row=3, max_row=n_rows + 2, values_only=True)):
+                values[idx] = [np.nan if value is None else float(value) for value in row[:len(columns)]] + \
+                              [np.nan] * (len(columns) - len(row))
+        except (TypeError, ValueError):
+            del values
+            os.remove(f"{array_file}.tmp.npy")
+            return False
+        values.flush()
+        del values
+    finally:
+        workbook.close()
+    os.replace(f"{array_file}.tmp.npy", array_file)
+    write_cache_description(file=file, columns=columns, shape=(n_rows, len(columns)))
+    return True
+
+
+def read_excel_cache(file: str, mmap_mode: str = "r"):
+    """
+    Loads the cached dataframe if it was made from the current version of the Excel file.
+    A changed modification time alone does not invalidate the cache if the content is the same.
+    :param str file: the path of the Excel file
+    :param str mmap_mode: the memory-mapping mode of the array, None loads it into memory
+    :return pd.DataFrame: the dataframe, None if there is no valid cache
+    """
+    array_file, meta_file = cache_paths(file=file)
+    if not os.path.isfile(array_file) or not os.path.isfile(meta_file):
+        return None
+    with open(meta_file) as in_file:
+        meta = json.load(in_file)
+    stat = os.stat(file)
+    source = meta["source"]
+    if stat.st_size != source["size"]:
+        return None
+    if stat.st_mtime_ns != source["mtime_ns"]:
+        if file_hash(file=file) != source["sha256"]:
+            return None
+        source["mtime_ns"] = stat.st_mtime_ns
+        replace_json(file=meta_file, content=meta)
+    values = np.load(array_file, mmap_mode=mmap_mode)
+    if list(values.shape) != meta["shape"]:
+        return None
+    columns = pd.MultiIndex.from_tuples([tuple(column) for column in meta["columns"]])
+    return pd.DataFrame(values, columns=columns, copy=False)
+
+
+def load_excel(file: str, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Loads the Excel file with the two-level header, from the binary cache if it is up to date.
+    :param str file: the path of the Excel file
+    :param bool use_cache: if false the Excel file is always parsed
+    :return pd.DataFrame: the data
+    """
+    if use_cache:
+        data = read_excel_cache(file=file)
+        if data is not None:
+            return data
+    data = pd.read_excel(file, header=[0, 1])
+    if use_cache and write_excel_cache(file=file, data=data):
+        return read_excel_cache(file=file)
+    return data
+
 
 class Downloader:
     """
     This class downloads the data.
     """
-    def __init__(self, gdrive_id: str = None, file_name: str = None) -> None:
+    def __init__(self, gdrive_id: str = None, file_name: str = None, use_cache: bool = True, url: str = None,
+                 sha256: str = None, session: "requests.Session" = None, retries: int = 3,
+                 timeout: float = 30) -> None:
         """
         Constructor for downloading and loading the data file.
         :param str gdrive_id: Google Drive id
         :param str file_name: file name for saving
+        :param bool use_cache: if true the workbook is converted once to a memory-mapped binary file in data/
+        :param str url: the address of the file, used instead of the Google Drive link if given
+        :param str sha256: the expected sha256 hash of the file, a saved file with another hash is downloaded again
+        :param requests.Session session: the session of the requests, by default the shared one
+        :param int retries: the number of the repeated attempts after a failed download
+        :param float timeout: the timeout of the connection and of the reading in seconds
+        """
+        if (gdrive_id is not None or url is not None) and file_name is not None:
+            file = os.path.join(data_folder(), file_name)
+            fetch_file(file=file, url=url if url is not None else GDRIVE_LINK + gdrive_id, sha256=sha256,
+                       session=session, retries=retries, timeout=timeout)
+            self.data = load_excel(file=file, use_cache=use_cache)
+
+
+class DataSource(NamedTuple):
+    """
+    One recording session to load, given by its Google Drive id or its address.
+    """
+    session: str
+    file_name: str
+    gdrive_id: str = None
+    url: str = None
+    sha256: str = None
+
+    @property
+    def link(self) -> str:
+        """
+        :return str: the address of the file
+        """
+        return self.url if self.url is not None else GDRIVE_LINK + self.gdrive_id
+
+
+def parse_file(file: str, use_cache: bool) -> tuple:
+    """
+    Parses the Excel file, this runs in the worker processes.
+    With the cache only the binary file is written, the main process maps it instead of receiving the data.
+    :param str file: the path of the Excel file
+    :param bool use_cache: if true the binary cache is written
+    :return tuple: the dataframe (None if it was cached) and the time of the parsing
+    """
+    start = time.perf_counter()
+    data = pd.read_excel(file, header=[0, 1])
+    if use_cache and write_excel_cache(file=file, data=data):
+        data = None
+    return data, time.perf_counter() - start
+
+
+def merge_sessions(frames: dict) -> pd.DataFrame:
+    """
+    Merges the data of the sessions, the cells are named "session/cell".
+    The columns of the shorter sessions are padded with NaN values.
+    :param dict frames: {session: dataframe}
+    :return pd.DataFrame: the dataframe of every cell, in the order of the sessions
+    """
+    renamed = []
+    for session, frame in frames.items():
+        columns = pd.MultiIndex.from_tuples([(f"{session}/{cell}", field) for cell, field in frame.columns])
+        renamed.append(frame.set_axis(columns, axis=1))
+    return pd.concat(renamed, axis=1)
+
+
+class MultiDownloader:
+    """
+    This class downloads and loads the data of many recording sessions concurrently.
+    The files are downloaded in a thread pool with pooled connections, and every file is parsed in a process pool
+    as soon as it arrived, so the loading takes about as long as the slowest file. With one parsing worker the
+    files are parsed in the thread pool and no process is started.
+    """
+    def __init__(self, sources: list, use_cache: bool = True, max_workers: int = 8, parse_workers: int = None,
+                 retries: int = 3, timeout: float = 30) -> None:
+        """
+        :param list sources: the DataSources, the session names have to be unique
+        :param bool use_cache: if true the workbooks are converted once to memory-mapped binary files in data/
+        :param int max_workers: the number of the concurrent downloads
+        :param int parse_workers: the number of the parsing processes, 1 parses in the threads of the main process
+        :param int retries: the number of the repeated attempts after a failed download
+        :param float timeout: the timeout of the connection and of the reading in seconds
+        """
+        sessions = [source.session for source in sources]
+        if len(set(sessions)) != len(sessions):
+            raise ValueError("The session names have to be unique.")
+        start = time.perf_counter()
+        folder = data_folder()
+        session = make_session(pool_size=max_workers)
+        frames, timings = {}, {}
+        processes = None
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as threads:
+                fetches = {threads.submit(self.fetch, source=source, file=os.path.join(folder, source.file_name),
+                                          session=session, retries=retries, timeout=timeout): source
+                           for source in sources}
+                parses = {}
+                for future in as_completed(fetches):
+                    source = fetches[future]
+                    file = os.path.join(folder, source.file_name)
+                    downloaded, seconds = future.result()
+                    timings[source.session] = {"file": source.file_name, "bytes": os.path.getsize(file),
+                                               "downloaded": downloaded, "fetch_seconds": seconds}
+                    frames[source.session] = read_excel_cache(file=file) if use_cache else None
+                    if frames[source.session] is not None:
+                        timings[source.session].update({"from_cache": True, "parse_seconds": 0.0})
+                    elif parse_workers is not None and parse_workers <= 1:
+                        parses[source.session] = threads.submit(parse_file, file, use_cache)
+                    else:
+                        # the processes are only started if a file has to be parsed
+                        if processes is None:
+                            processes = ProcessPoolExecutor(max_workers=parse_workers)
+                        parses[source.session] = processes.submit(parse_file, file, use_cache)
+                for name, parse in parses.items():
+                    data, seconds = parse.result()
+                    file = os.path.join(folder, timings[name]["file"])
+                    frames[name] = data if data is not None else read_excel_cache(file=file)
+                    timings[name].update({"from_cache": False, "parse_seconds": seconds})
+        finally:
+            session.close()
+            if processes is not None:
+                processes.shutdown()
+        self.frames = {name: frames[name] for name in sessions}
+        self.data = merge_sessions(frames=self.frames)
+        self.timings = pd.DataFrame.from_dict({name: timings[name] for name in sessions}, orient="index")
+        self.total_seconds = time.perf_counter() - start
+
+    @staticmethod
+    def fetch(source: DataSource, file: str, session: "requests.Session", retries: int, timeout: float) -> tuple:
+        """
+        :param DataSource source: the session to download
+        :param str file: the path to save the file to
+        :param requests.Session session: the session of the requests
+        :param int retries: the number of the repeated attempts after a failed download
+        :param float timeout: the timeout of the connection and of the reading in seconds
+        :return tuple: true if the file was downloaded and the time of the downloading
         """
-        if gdrive_id is not None and file_name is not None:
-            gdrive_link = "https://drive.google.com/uc?export=download&id="
-            data_folder = os.path.join(PROJECT_PATH, "data")
-            data_generated = os.path.join(PROJECT_PATH, "generated")
-            os.makedirs(data_generated, exist_ok=True)
-            os.path.join(data_folder, "generated")
-            os.makedirs(data_folder, exist_ok=True)
-            file = os.path.join(data_folder, file_name)
-            if not os.path.isfile(file):
-                r = requests.get(gdrive_link + gdrive_id, allow_redirects=True)
-                open(file, "wb").write(r.content)
-            self.data = pd.read_excel(file, header=[0, 1])
+        start = time.perf_counter()
+        downloaded = fetch_file(file=file, url=source.link, sha256=source.sha256, session=session, retries=retries,
+                                timeout=timeout)
+        return downloaded, time.perf_counter() - start
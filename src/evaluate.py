@@ -1,15 +1,59 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-import statsmodels.api as sm
-from scipy import stats
-from sklearn.metrics import mean_squared_error, r2_score
 
 from src.datamanipulator import DataManipulator
-from src.lm_fit import LMFit
+from src.diagnostics import diagnose
+from src.lm_fit import LMFit, fit_values, fitted_curve
+from src.models import model_name
+from src.ols import ols_from_sums, prefix_statistics, sufficient_statistics
 from src.plot import Plotter
 
 
+def threshold_order(if_values: np.ndarray, thresholds) -> tuple:
+    """
+    Sorts the points by IF once for a threshold sweep, the NaN values are never above a threshold.
+    :param np.ndarray if_values: the IF values
+    :param thresholds: the IF thresholds
+    :return tuple: the order the points are admitted in and the number of the points under each threshold
+    """
+    nan = np.flatnonzero(np.isnan(if_values))
+    valid = np.flatnonzero(~np.isnan(if_values))
+    valid = valid[np.argsort(if_values[valid], kind="stable")]
+    counts = len(nan) + np.searchsorted(if_values[valid], np.asarray(thresholds), side="right")
+    return np.concatenate((nan, valid)), counts
+
+
+def threshold_frames(frame: pd.DataFrame, thresholds) -> tuple:
+    """
+    Gives the points of the frame with IF not above each threshold, from the smallest threshold to the largest.
+    The frame is sorted by IF once and every threshold only admits the new points, the points keep their order.
+    :param pd.DataFrame frame: the points of a spike
+    :param thresholds: the IF thresholds
+    :return tuple: the position of the threshold, the threshold and the points under it
+    """
+    thresholds = np.asarray(thresholds)
+    order, counts = threshold_order(if_values=frame["IF"].to_numpy(), thresholds=thresholds)
+    keep = np.zeros(len(frame), dtype=bool)
+    admitted = 0
+    for item in np.argsort(thresholds, kind="stable"):
+        keep[order[admitted:counts[item]]] = True
+        admitted = max(admitted, counts[item])
+        yield item, thresholds[item], frame[keep]
+
+
+def regression_outputs(result: dict, index: list, item=None) -> tuple:
+    """
+    Converts the results of ols_from_sums to the outputs of Evaluate.linear_regression.
+    :param dict result: the results of one or many regressions
+    :param list index: the names of the constant and the variable
+    :param item: the position of the regression, None if there is only one
+    :return tuple: p-values, r square, confidence intervals, p-value of F, F and the parameters
+    """
+    part = {key: value if item is None else value[item] for key, value in result.items()}
+    return (pd.Series(part["pvalues"], index=index), part["rsquared"], pd.DataFrame(part["conf_int"], index=index),
+            part["f_pvalue"], part["fvalue"], pd.Series(part["params"], index=index))
+
+
 class Evaluate:
     """
     This class makes the evaluation.
@@ -30,81 +74,94 @@ class Evaluate:
         self.multiindex_dictionary = {}
 
     def count_if_threshold(self, cell_name, spike_name, func_class, param_values, threshold, ax,
-                           chosen_cells, linear_regression: bool, log: bool):
+                           chosen_cells, linear_regression: bool, log: bool, warm_start: bool = False):
+        """
+        Fits the points of a spike under increasing IF thresholds.
+        :param ax: the axes of the thresholds' plots, None skips the plots
+        :param bool warm_start: if true every threshold's fit starts from the previous threshold's result
+        """
         if isinstance(chosen_cells, list):
             cell_name = "all"
-        if cell_name not in self.fit_parameters:
-            self.fit_parameters[cell_name] = dict()
-        self.fit_parameters[cell_name][spike_name] = dict()
-        if log or linear_regression:
-            threshold = np.log10(threshold)
-            dict_frame = np.log10(self.data_class.create_frame(cell_name=cell_name, spike=spike_name,
-                                                               y=False, do_all=False, chosen_cells=chosen_cells))
-        else:
-            threshold = threshold
-            dict_frame = self.data_class.create_frame(cell_name=cell_name, spike=spike_name,
-                                                      y=False, do_all=False, chosen_cells=chosen_cells)
-
-        for item, num in enumerate(threshold):
+        stage = self.lm_fit.instrumentation.stage
+        labels = {"function": "count_if_threshold", "model": model_name(func_class), "cell": cell_name,
+                  "spike": spike_name}
+        with stage("prepare", **labels):
+            if cell_name not in self.fit_parameters:
+                self.fit_parameters[cell_name] = dict()
+            self.fit_parameters[cell_name][spike_name] = dict()
             if log or linear_regression:
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)] = dict()
+                threshold = np.log10(threshold)
+                dict_frame = np.log10(self.data_class.create_frame(cell_name=cell_name, spike=spike_name,
+                                                                   y=False, do_all=False,
+                                                                   chosen_cells=chosen_cells))
             else:
-                self.fit_parameters[cell_name][spike_name][num] = dict()
-            df = dict_frame
-            for i in range(len(dict_frame)-1, -1, -1):
-                if dict_frame["IF"].iloc[i] > num:
-                    df = df.drop(labels=i, axis=0)
-            result, chisq = self.lm_fit.fit_the_function(func_class=func_class, param_values=param_values,
-                                                         x=df["relative firing time"], data=df["IF"])
-            final = func_class(params=result.params, x=df["relative firing time"])
-            mean = np.mean(df["IF"])
-            if linear_regression:
-                r_2 = (np.sum((mean - df["IF"]) ** 2) - np.sum((df["IF"] - final) ** 2)) / np.sum(
-                    (mean - df["IF"]) ** 2)
-                p, r_square, conf_int, fp, f, params = self.linear_regression(x=df["relative firing time"], y=df["IF"])
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["p"] = p
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_square"] = r_square
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["conf_int"] = conf_int
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] = r_2
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["fp"] = fp
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["f"] = f
-
-            elif log is True and linear_regression is False:
-                params = list(result.params.valuesdict().values())
-                chi2_stat = np.sum(
-                    result.residual ** 2 / func_class(params=result.params, x=df["relative firing time"]))
-                # self.fit_parameters[cell_name][spike_name][round(10 ** num)]["params"] = list(result.params.valuesdict().values())
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["aic"] = result.aic
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["bic"] = result.bic
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] = r2_score(y_true=df["IF"],
-                                                                                               y_pred=func_class(
-                                                                                                   params=result.params,
-                                                                                                   x=df["relative firing time"]))
-                self.fit_parameters[cell_name][spike_name][round(10 ** num)]["p"] = 1 - stats.chi2.cdf(chisq,
-                                                                                                       result.nfree)
+                threshold = threshold
+                dict_frame = self.data_class.create_frame(cell_name=cell_name, spike=spike_name,
+                                                          y=False, do_all=False, chosen_cells=chosen_cells)
 
-            else:
-                params = list(result.params.valuesdict().values())
-                chi2_stat = np.sum(result.residual ** 2 / func_class(params=result.params, x=df["relative firing time"]))
-                # self.fit_parameters[cell_name][spike_name][num]["params"] = list(result.params.valuesdict().values())
-                # self.fit_parameters[cell_name][spike_name][num]["chi_sqr"] = result.chisqr
-                self.fit_parameters[cell_name][spike_name][num]["aic"] = result.aic
-                self.fit_parameters[cell_name][spike_name][num]["bic"] = result.bic
-                self.fit_parameters[cell_name][spike_name][num]["r_2"] = r2_score(y_true=df["IF"],
-                                                                                  y_pred=func_class(
-                                                                                      params=result.params,
-                                                                                      x=df["relative firing time"]))
-                self.fit_parameters[cell_name][spike_name][num]["p"] = 1 - stats.chi2.cdf(chisq,
-                                                                                          result.nfree)
+            for num in threshold:
+                if log or linear_regression:
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)] = dict()
+                else:
+                    self.fit_parameters[cell_name][spike_name][num] = dict()
 
             if linear_regression:
-                self.plotter.different_if_plotter(df=df, p=params, ax=ax, idx=item, threshold=threshold)
-            elif log:
-                self.plotter.plot_fitted_data_eval(x=df["relative firing time"], data=df["IF"], final=final, log=log,
-                                                   plot_name=round(10 ** num), ax=ax, id=item)
-            else:
-                self.plotter.plot_fitted_data_eval(x=df["relative firing time"], data=df["IF"], final=final, log=log,
-                                                   plot_name=num, ax=ax, id=item)
+                regressions = self.threshold_linear_regression(frame=dict_frame, thresholds=threshold)
+
+        flags = {"log": log, "linear_regression": linear_regression}
+        init_values = None
+        for item, num, df in threshold_frames(frame=dict_frame, thresholds=threshold):
+            threshold_labels = {**labels, "threshold": round(10 ** num) if log or linear_regression else num}
+            with stage("fit", **threshold_labels):
+                if warm_start:
+                    result, chisq = self.lm_fit.warm_start_fit(func_class=func_class, param_values=param_values,
+                                                               x=df["relative firing time"], data=df["IF"],
+                                                               init_values=init_values,
+                                                               label=(cell_name, spike_name, num), flags=flags)
+                    init_values = fit_values(result=result, n_params=func_class.n_params)
+                else:
+                    result, chisq = self.lm_fit.fit_the_function(func_class=func_class, param_values=param_values,
+                                                                 x=df["relative firing time"], data=df["IF"],
+                                                                 flags=flags)
+            with stage("diagnose", **threshold_labels):
+                final = fitted_curve(func_class=func_class, result=result, x=df["relative firing time"])
+                diagnostics = diagnose(result=result, data=df["IF"], fitted=final, n_params=func_class.n_params,
+                                       log=False)
+                if linear_regression:
+                    p, r_square, conf_int, fp, f, params = regressions[item]
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["p"] = p
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_square"] = r_square
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["conf_int"] = conf_int
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] = diagnostics.r_2
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["fp"] = fp
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["f"] = f
+
+                elif log is True and linear_regression is False:
+                    # self.fit_parameters[cell_name][spike_name][round(10 ** num)]["params"] = list(result.params.valuesdict().values())
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["aic"] = diagnostics.aic
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["bic"] = diagnostics.bic
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] = diagnostics.r_2
+                    self.fit_parameters[cell_name][spike_name][round(10 ** num)]["p"] = diagnostics.p_value
+
+                else:
+                    # self.fit_parameters[cell_name][spike_name][num]["params"] = list(result.params.valuesdict().values())
+                    # self.fit_parameters[cell_name][spike_name][num]["chi_sqr"] = result.chisqr
+                    self.fit_parameters[cell_name][spike_name][num]["aic"] = diagnostics.aic
+                    self.fit_parameters[cell_name][spike_name][num]["bic"] = diagnostics.bic
+                    self.fit_parameters[cell_name][spike_name][num]["r_2"] = diagnostics.r_2
+                    self.fit_parameters[cell_name][spike_name][num]["p"] = diagnostics.p_value
+
+            with stage("plot", **threshold_labels):
+                if ax is None:
+                    pass
+                elif linear_regression:
+                    self.plotter.different_if_plotter(df=df, p=params, ax=ax, idx=item, threshold=threshold)
+                elif log:
+                    self.plotter.plot_fitted_data_eval(x=df["relative firing time"], data=df["IF"], final=final,
+                                                       log=log, plot_name=round(10 ** num), ax=ax, id=item)
+                else:
+                    self.plotter.plot_fitted_data_eval(x=df["relative firing time"], data=df["IF"], final=final,
+                                                       log=log, plot_name=num, ax=ax, id=item)
         if linear_regression:
             if self.fit_parameters[cell_name][spike_name][round(10 ** threshold[-1])]["fp"] > 0.05 and \
                     self.fit_parameters[cell_name][spike_name][round(10 ** threshold[-1])]["r_2"] < 0.6:
@@ -122,42 +179,63 @@ class Evaluate:
                     append_name = "curve_fit" + cell_name + spike_name
                     self.bad_lin_regression.append(append_name)
 
-        self.plotter.plotter_params(cell_name=cell_name, spike_name=spike_name, thresholds=threshold,
-                                    dictionary=self.fit_parameters, linear_regression=linear_regression, log=log)
+        with stage("save", **labels):
+            if self.plotter.renderer is not None:
+                spec = self.plotter.params_spec(cell_name=cell_name, spike_name=spike_name, thresholds=threshold,
+                                                dictionary=self.fit_parameters, linear_regression=linear_regression,
+                                                log=log)
+                self.plotter.renderer.submit(spec)
+            else:
+                self.plotter.plotter_params(cell_name=cell_name, spike_name=spike_name, thresholds=threshold,
+                                            dictionary=self.fit_parameters, linear_regression=linear_regression,
+                                            log=log)
 
-        if linear_regression:
-            dictionary = {cell_name: {'fp': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["fp"] for num in threshold],
-                                      'r_2': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] for num in threshold]}}
-        else:
-            if log:
-                dictionary = {
-                    cell_name: {'p': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["p"] for num in threshold],
-                                'r_2': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] for num in threshold]}}
+            if linear_regression:
+                dictionary = {cell_name: {'fp': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["fp"] for num in threshold],
+                                          'r_2': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] for num in threshold]}}
             else:
-                dictionary = {
-                    cell_name: {'p': [self.fit_parameters[cell_name][spike_name][num]["p"] for num in threshold],
-                                'r_2': [self.fit_parameters[cell_name][spike_name][num]["r_2"] for num in threshold]}}
-        reform = {(outerKey, innerKey): values for outerKey, innerDict in dictionary.items() for innerKey, values in
-                  innerDict.items()}
-        df = pd.DataFrame.from_dict(reform, orient='index').transpose()
-        df.columns = pd.MultiIndex.from_tuples(df.columns)
-
-        evaluat = cell_name + str(func_class.n_params) + '.xlsx'
-        file_eval = "../generated/" + evaluat
-        df.to_excel(file_eval)
+                if log:
+                    dictionary = {
+                        cell_name: {'p': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["p"] for num in threshold],
+                                    'r_2': [self.fit_parameters[cell_name][spike_name][round(10 ** num)]["r_2"] for num in threshold]}}
+                else:
+                    dictionary = {
+                        cell_name: {'p': [self.fit_parameters[cell_name][spike_name][num]["p"] for num in threshold],
+                                    'r_2': [self.fit_parameters[cell_name][spike_name][num]["r_2"] for num in threshold]}}
+            reform = {(outerKey, innerKey): values for outerKey, innerDict in dictionary.items() for innerKey, values in
+                      innerDict.items()}
+            df = pd.DataFrame.from_dict(reform, orient='index').transpose()
+            df.columns = pd.MultiIndex.from_tuples(df.columns)
+
+            evaluat = cell_name + str(func_class.n_params) + '.xlsx'
+            file_eval = "../generated/" + evaluat
+            df.to_excel(file_eval)
 
     @staticmethod
     def linear_regression(x, y):
-        x = sm.add_constant(x)
-        model = sm.OLS(y, x)
-        result = model.fit()
-        params = result.params
-        p = result.pvalues
-        r_square = result.rsquared
-        conf_int = result.conf_int(alpha=0.05, cols=None)
-        fp = result.f_pvalue
-        f = result.fvalue
-        return p, r_square, conf_int, fp, f, params
+        """
+        Fits y = const + slope * x with ordinary least squares from the sums of the data,
+        the outputs are the same as statsmodels'.
+        :return tuple: p-values, r square, confidence intervals, p-value of F, F and the parameters
+        """
+        shift = (np.mean(x), np.mean(y))
+        result = ols_from_sums(**sufficient_statistics(x=x, y=y, shift=shift), shift=shift)
+        return regression_outputs(result=result, index=["const", getattr(x, "name", None) or "x1"])
+
+    @staticmethod
+    def threshold_linear_regression(frame: pd.DataFrame, thresholds) -> list:
+        """
+        Makes the linear regression of the points under every IF threshold at once from prefix sums.
+        :param pd.DataFrame frame: the points of a spike
+        :param thresholds: the IF thresholds
+        :return list: the outputs of linear_regression for every threshold
+        """
+        x, y = frame["relative firing time"].to_numpy(), frame["IF"].to_numpy()
+        order, counts = threshold_order(if_values=y, thresholds=thresholds)
+        shift = (np.nanmean(x), np.nanmean(y))
+        result = ols_from_sums(**prefix_statistics(x=x, y=y, order=order, counts=counts, shift=shift), shift=shift)
+        return [regression_outputs(result=result, index=["const", "relative firing time"], item=item)
+                for item in range(len(counts))]
 
     def compare_values_to_original(self):
         pass
@@ -193,7 +271,7 @@ class Evaluate:
             x = np.log10(df["relative firing time"][0:int(num)])
             data = np.log10(df["IF"][0:int(num)])
             result = self.lm_fit.fit_the_function(func_class=func_class, param_values=param_values, x=x, data=data)
-            final = func_class(params=result.params, x=x)
+            final = fitted_curve(func_class=func_class, result=result, x=x)
             self.squared_diff_dict[cell_name][str(num)] = (data - final) ** 2
         """
 
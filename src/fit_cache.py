@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from src import PROJECT_PATH
+from src.lm_fit import SOLVER_OPTIONS, FitResult, fit_values
+
+
+def func_identity(func_class) -> str:
+    """
+    :param func_class: the func_class of a fitting
+    :return str: the importable name of the func_class and its version
+    """
+    owner = func_class if hasattr(func_class, "__qualname__") else type(func_class)
+    name = f"{owner.__module__}.{owner.__qualname__}"
+    return f"{name}:{getattr(func_class, 'name', '')}:{getattr(func_class, 'version', '')}"
+
+
+class FitCache:
+    """
+    Saves the converged fittings on disk, keyed by the hash of everything that determines the result.
+    The least recently used fittings are removed when the size of the cache exceeds the limit.
+    A func_class can set a version attribute, increasing it invalidates its saved fittings.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 256 * 1024 ** 2) -> None:
+        """
+        :param str directory: the folder of the cache, by default generated/fit_cache in the project
+        :param int max_bytes: the maximal size of the cache
+        """
+        self.directory = directory if directory is not None else os.path.join(PROJECT_PATH, "generated",
+                                                                               "fit_cache")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".npz"))
+
+    @staticmethod
+    def key(func_class, param_values, x, data, init_values=None, flags: dict = None) -> str:
+        """
+        :param func_class: the func_class that includes the equation of the curve to be fitted
+        :param tuple param_values: the initial value and the lower bound of the parameters
+        :param x: the independent variable
+        :param data: the data to fit
+        :param init_values: the initial values of the parameters
+        :param dict flags: the settings of the data, for example log and switch_axes
+        :return str: the hash of the fitting
+        """
+        digest = hashlib.sha256()
+        for values in (x, data):
+            digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+            digest.update(b"|")
+        settings = {"func_class": func_identity(func_class=func_class), "param_values": list(param_values),
+                    "init_values": None if init_values is None else np.asarray(init_values, dtype=float).tolist(),
+                    "flags": flags or {}, "solver": SOLVER_OPTIONS}
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        """
+        :param str key: the hash of the fitting
+        :return str: the file of the fitting
+        """
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key: str, param_values: tuple):
+        """
+        :param str key: the hash of the fitting
+        :param tuple param_values: the initial value and the lower bound of the parameters
+        :return FitResult: the saved result, None if it is not in the cache
+        """
+        file = self.path(key=key)
+        try:
+            with np.load(file) as saved:
+                meta = json.loads(str(saved["meta"]))
+                result = FitResult(values=saved["values"], param_values=param_values, residual=saved["residual"],
+                                   nfev=meta["nfev"], njev=meta["njev"], success=meta["success"],
+                                   message=meta["message"])
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            self.misses += 1
+            return None
+        os.utime(file)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result, n_params: int) -> None:
+        """
+        Saves a result and removes the least recently used ones above the size limit.
+        :param str key: the hash of the fitting
+        :param result: the result of the minimization
+        :param int n_params: the number of the parameters
+        """
+        meta = {"nfev": int(result.nfev), "njev": int(getattr(result, "njev", 0) or 0),
+                "success": bool(result.success), "message": str(result.message)}
+        file = self.path(key=key)
+        temporary = f"{file}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as out_file:
+            np.savez(out_file, values=fit_values(result=result, n_params=n_params),
+                     residual=np.asarray(result.residual, dtype=float), meta=json.dumps(meta))
+        old_size = os.path.getsize(file) if os.path.isfile(file) else 0
+        os.replace(temporary, file)
+        self.size += os.path.getsize(file) - old_size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used fittings until the cache is under its size limit.
+        """
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith(".npz")),
+                         key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            self.size -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def invalidate(self, key: str = None) -> None:
+        """
+        Removes a fitting, or every fitting if the key is None.
+        :param str key: the hash of the fitting
+        """
+        if key is not None:
+            files = [self.path(key=key)]
+        else:
+            files = [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".npz")]
+        for file in files:
+            if os.path.isfile(file):
+                self.size -= os.path.getsize(file)
+                os.remove(file)
+
+    def info(self) -> dict:
+        """
+        :return dict: the number of hits, misses and the size of the cache
+        """
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.size, "max_bytes": self.max_bytes}
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from src.datamanipulator import DataManipulator
+from src.lm_fit import SOLVER_OPTIONS, least_squares_fit
+from src.models import Model
+
+
+class JointProblem:
+    """
+    The least squares problem of one spike of many cells: the parameters of a cell are the population parameters
+    plus the offsets of the cell, and the offsets are pulled towards 0 by a ridge penalty.
+    The parameter vector is [population, offsets of the first cell, offsets of the second cell, ...], so a point
+    depends on the population block and on the block of its cell only, the Jacobian is block-sparse.
+    """
+
+    def __init__(self, model: Model, points: list, penalty: float) -> None:
+        """
+        :param Model model: the registered model, its evaluate has to work point by point
+        :param list points: x and the data of every cell
+        :param float penalty: the weight of the squared offsets in the loss
+        """
+        self.model = model
+        self.n_params = model.n_params
+        self.n_cells = len(points)
+        self.sizes = np.array([len(x) for x, _ in points])
+        self.bounds = np.concatenate(([0], np.cumsum(self.sizes)))
+        self.x = np.concatenate([x for x, _ in points])
+        self.data = np.concatenate([data for _, data in points])
+        self.cell_ids = np.repeat(np.arange(self.n_cells), self.sizes)
+        self.ridge = np.sqrt(penalty)
+
+        n_points, p = len(self.x), self.n_params
+        # a point's row has the population columns, then the columns of its cell
+        point_columns = np.concatenate((np.tile(np.arange(p), (n_points, 1)),
+                                        p + self.cell_ids[:, None] * p + np.arange(p)), axis=1)
+        self.indices = np.concatenate((point_columns.ravel(), p + np.arange(self.n_cells * p)))
+        self.indptr = np.concatenate((np.arange(n_points + 1) * 2 * p,
+                                      2 * p * n_points + np.arange(1, self.n_cells * p + 1)))
+        self.shape = (n_points + self.n_cells * p, p * (self.n_cells + 1))
+
+    def cell_params(self, theta: np.ndarray) -> np.ndarray:
+        """
+        :param np.ndarray theta: the parameter vector
+        :return np.ndarray: the parameters of the cells, shape (n_cells, n_params)
+        """
+        return theta[:self.n_params] + theta[self.n_params:].reshape(self.n_cells, self.n_params)
+
+    def residual(self, theta: np.ndarray) -> np.ndarray:
+        """
+        :param np.ndarray theta: the parameter vector
+        :return np.ndarray: the residuals of the points, then the penalty of the offsets
+        """
+        params = self.cell_params(theta=theta)[self.cell_ids]
+        fitted = self.model.evaluate(p=params, x=self.x[:, None])[:, 0]
+        return np.concatenate((fitted - self.data, self.ridge * theta[self.n_params:]))
+
+    def jacobian(self, theta: np.ndarray) -> csr_matrix:
+        """
+        :param np.ndarray theta: the parameter vector
+        :return csr_matrix: the derivatives of the residuals, the derivatives of a point by the population and by
+        its cell's offsets are the same
+        """
+        params = self.cell_params(theta=theta)
+        rows = np.empty((len(self.x), self.n_params))
+        for cell in range(self.n_cells):
+            part = slice(self.bounds[cell], self.bounds[cell + 1])
+            rows[part] = self.model.jacobian(p=params[cell], x=self.x[part])
+        values = np.concatenate((np.concatenate((rows, rows), axis=1).ravel(),
+                                 np.full(self.n_cells * self.n_params, self.ridge)))
+        return csr_matrix((values, self.indices, self.indptr), shape=self.shape)
+
+    def sparsity(self) -> csr_matrix:
+        """
+        :return csr_matrix: the structure of the Jacobian, for the finite differences
+        """
+        return csr_matrix((np.ones(len(self.indices)), self.indices, self.indptr), shape=self.shape)
+
+
+def joint_fit(model: Model, points: list, param_values: tuple, penalty: float = 1.0) -> tuple:
+    """
+    Fits the population and the per-cell parameters of a spike in one least squares problem.
+    The population starts from the fit of the pooled points and the offsets from 0. The lower bound of
+    param_values bounds the population parameters, the offsets are only limited by the penalty.
+    :param Model model: the registered model
+    :param list points: x and the data of every cell
+    :param tuple param_values: the initial value and the lower bound of the parameters
+    :param float penalty: the weight of the squared offsets in the loss, larger values shrink the cells more
+    :return tuple: the population parameters, the parameters of the cells and scipy's result
+    """
+    from scipy.optimize import least_squares
+
+    problem = JointProblem(model=model, points=points, penalty=penalty)
+    pooled = least_squares_fit(model=model, param_values=param_values, x=problem.x, data=problem.data)
+    start = np.concatenate((pooled.values,
+                            np.zeros(problem.n_cells * model.n_params)))
+    lower = np.concatenate((np.full(model.n_params, param_values[1], dtype=float),
+                            np.full(problem.n_cells * model.n_params, -np.inf)))
+    if model.jacobian(p=start[:model.n_params], x=problem.x[:1]) is None:
+        options = {"jac": "2-point", "jac_sparsity": problem.sparsity()}
+    else:
+        options = {"jac": problem.jacobian}
+    ret = least_squares(problem.residual, start, bounds=(lower, np.inf), tr_solver="lsmr",
+                        max_nfev=4000 * (model.n_params + 1), **options, **SOLVER_OPTIONS)
+    return ret.x[:model.n_params], problem.cell_params(theta=ret.x), ret
+
+
+class HierarchicalFitter:
+    """
+    Fits the spikes of many cells jointly: shared population parameters plus shrunk per-cell offsets,
+    between fitting the pooled points (do_all) and fitting every cell on its own.
+    """
+
+    def __init__(self, data_class: DataManipulator) -> None:
+        """
+        :param DataManipulator data_class: the DataManipulator class
+        """
+        self.data_class = data_class
+        self.info = []
+
+    def fit(self, range_spike: int, func_class: Model, param_values: tuple, chosen_cells: list = None,
+            log: bool = True, switch_axes: bool = False, penalty: float = 1.0) -> tuple:
+        """
+        :param int range_spike: the number of the spikes to fit, starting from the first
+        :param Model func_class: the registered model
+        :param tuple param_values: the initial value and the lower bound of the parameters
+        :param list chosen_cells: the names of the cells, by default every cell
+        :param bool log: if true the logarithm of the data is fitted
+        :param bool switch_axes: if true IF is the independent variable
+        :param float penalty: the weight of the squared offsets in the loss
+        :return tuple: the population parameters (like LMFit's df_n) and the parameters of the cells
+        (indexed by cell and spike, df.loc[cell] is like df_n), the cells without points in a spike are left out
+        """
+        if not isinstance(func_class, Model):
+            raise TypeError("The joint fitting needs a registered model.")
+        names = self.data_class.names if chosen_cells is None else chosen_cells
+        letters = [f"a{i + 1}" for i in range(func_class.n_params)]
+        population = pd.DataFrame(index=[i + 1 for i in range(range_spike)], columns=letters, dtype=float)
+        cells = []
+        for spike in range(1, range_spike + 1):
+            points, fitted_names = [], []
+            for name in names:
+                x, data = self.data_class.define_axes(cell_name=name, string=f"{spike}.spike", do_all=False,
+                                                      log=log, switch_axes=switch_axes, chosen_cells=None)
+                finite = np.isfinite(x) & np.isfinite(data)
+                if finite.any():
+                    points.append((x[finite], data[finite]))
+                    fitted_names.append(name)
+            if not points:
+                continue
+            shared, per_cell, ret = joint_fit(model=func_class, points=points, param_values=param_values,
+                                              penalty=penalty)
+            population.loc[spike] = shared
+            cells.append(pd.DataFrame(per_cell, columns=letters,
+                                      index=pd.MultiIndex.from_product([fitted_names, [spike]])))
+            self.info.append({"spike": spike, "n_cells": len(points), "n_points": int(sum(len(x) for x, _ in points)),
+                              "cost": ret.cost, "nfev": ret.nfev, "success": bool(ret.success)})
+        if not cells:
+            return population, pd.DataFrame(columns=letters, dtype=float)
+        cells = pd.concat(cells)
+        positions = cells.index.get_level_values(0).map({name: idx for idx, name in enumerate(names)})
+        return population, cells.iloc[np.lexsort((cells.index.get_level_values(1), positions))]
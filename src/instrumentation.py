@@ -0,0 +1,127 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+_disabled = nullcontext()
+
+
+class Instrumentation:
+    """
+    Records the time of the stages of the fittings and the outcome of every fit.
+    The records are labelled with the labels of the stages they happened in, for example the cell and the spike.
+    When it is disabled the stages are a shared empty context and nothing is recorded.
+    """
+
+    def __init__(self, enabled: bool = True, profile: bool = False) -> None:
+        """
+        :param bool enabled: if false nothing is recorded
+        :param bool profile: if true cProfile runs while a stage of the outermost level is timed
+        """
+        self.enabled = enabled
+        self.fits = []
+        self.stages = []
+        self.hooks = []
+        self.context = {}
+        self.depth = 0
+        self.profiler = cProfile.Profile() if profile else None
+
+    def stage(self, name: str, **labels):
+        """
+        Times a stage, use it as a context manager.
+        :param str name: the name of the stage
+        :param labels: the labels of the records made in the stage, for example cell and spike
+        :return: the context of the stage
+        """
+        if not self.enabled:
+            return _disabled
+        return self.timed_stage(name=name, labels=labels)
+
+    @contextmanager
+    def timed_stage(self, name: str, labels: dict):
+        """
+        :param str name: the name of the stage
+        :param dict labels: the labels of the records made in the stage
+        """
+        previous = self.context
+        self.context = {**previous, **labels}
+        if self.profiler is not None and self.depth == 0:
+            self.profiler.enable()
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.depth -= 1
+            if self.profiler is not None and self.depth == 0:
+                self.profiler.disable()
+            self.add("stage", {**self.context, "stage": name, "seconds": seconds})
+            self.context = previous
+
+    def record_fit(self, **fields) -> None:
+        """
+        Saves the outcome of a fit with the labels of the current stage.
+        :param fields: the properties of the fit, for example seconds, nfev and success
+        """
+        if self.enabled:
+            self.add("fit", {**self.context, **fields})
+
+    def add(self, kind: str, record: dict) -> None:
+        """
+        :param str kind: "fit" or "stage"
+        :param dict record: the record
+        """
+        (self.fits if kind == "fit" else self.stages).append(record)
+        for hook in self.hooks:
+            hook(kind, record)
+
+    def add_hook(self, hook) -> None:
+        """
+        Adds a function that is called with the kind and the record of every new record, for example to trace them.
+        :param hook: the function
+        """
+        self.hooks.append(hook)
+
+    def fits_frame(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: one row for every fit
+        """
+        return pd.DataFrame(self.fits)
+
+    def stages_frame(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: one row for every timed stage
+        """
+        return pd.DataFrame(self.stages)
+
+    def summary(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the number, the total and the maximal time of the stages, the most expensive first
+        """
+        if not self.stages:
+            return pd.DataFrame(columns=["count", "total", "max"])
+        table = self.stages_frame().groupby("stage")["seconds"].agg(["count", "sum", "max"])
+        return table.rename(columns={"sum": "total"}).sort_values("total", ascending=False)
+
+    def profile_stats(self, sort: str = "cumulative", limit: int = 30) -> str:
+        """
+        :param str sort: the key to sort the functions by
+        :param int limit: the number of the functions shown
+        :return str: the cProfile statistics of the timed stages
+        """
+        if self.profiler is None:
+            return ""
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def clear(self) -> None:
+        """
+        Removes the records.
+        """
+        self.fits = []
+        self.stages = []
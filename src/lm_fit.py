@@ -1,18 +1,276 @@
 import json
+import time
+from typing import TYPE_CHECKING, NamedTuple
 
-from lmfit import Minimizer, Parameters
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-from sklearn.metrics import mean_squared_error, r2_score
-from scipy import stats
 
 from src.datamanipulator import DataManipulator
+from src.diagnostics import FitDiagnostics, diagnose, diagnostics_frame
+from src.instrumentation import Instrumentation
+from src.models import Model, model_name, parameter_vector
+from src.result_store import fit_tables
 from src.plot import Plotter
 
+if TYPE_CHECKING:
+    from lmfit import Parameters
+
+# the options of scipy's least_squares, the same as lmfit's defaults
+SOLVER_OPTIONS = {"method": "trf", "ftol": 1e-08, "xtol": 1e-08, "gtol": 1e-08}
+
+
+def create_parameters(num_params: int, fit_params: tuple) -> "Parameters":
+    """
+    Creates the parameters of the fitting, every parameter starts from the same value and lower bound.
+    :param int num_params: the number of the parameters
+    :param tuple fit_params: the initial value and the lower bound
+    :return Parameters: the parameters a1_param, a2_param, ...
+    """
+    from lmfit import Parameters
+
+    parameters = Parameters()
+    for i in range(num_params):
+        string = f"a{i + 1}_param"
+        parameters.add(string, value=fit_params[0], min=fit_params[1])
+    return parameters
+
+
+class FitResult:
+    """
+    The result of an array-native fitting with the attributes of lmfit's MinimizerResult used in this project.
+    """
+
+    def __init__(self, values: np.ndarray, param_values: tuple, residual: np.ndarray, nfev: int, njev: int,
+                 success: bool, message: str) -> None:
+        """
+        :param np.ndarray values: the fitted parameters
+        :param tuple param_values: the initial value and the lower bound of the parameters
+        :param np.ndarray residual: the model minus the data at the fitted parameters
+        :param int nfev: the number of the function evaluations
+        :param int njev: the number of the Jacobian evaluations
+        :param bool success: if true the solver converged
+        :param str message: the termination message of the solver
+        """
+        self.values = np.asarray(values, dtype=float)
+        self.param_values = param_values
+        self._params = None
+        self.residual = residual
+        self.nfev = nfev
+        self.njev = njev
+        self.success = success
+        self.message = message
+        self.nvarys = len(values)
+        self.ndata = len(residual)
+        self.nfree = self.ndata - self.nvarys
+        chisqr = (residual ** 2).sum()
+        self.redchi = chisqr / max(1, self.nfree)
+        # the same way as lmfit, this is -2*loglikelihood
+        self.chisqr = max(chisqr, 1.e-250 * self.ndata)
+        _neg2_log_likel = self.ndata * np.log(self.chisqr / self.ndata)
+        self.aic = _neg2_log_likel + 2 * self.nvarys
+        self.bic = _neg2_log_likel + np.log(self.ndata) * self.nvarys
+
+    @property
+    def params(self) -> "Parameters":
+        """
+        :return Parameters: the fitted parameters as lmfit Parameters, created when they are first used
+        """
+        if self._params is None:
+            self._params = create_parameters(num_params=len(self.values), fit_params=self.param_values)
+            for i, value in enumerate(self.values):
+                self._params[f"a{i + 1}_param"].value = value
+        return self._params
+
+
+def fit_values(result, n_params: int) -> np.ndarray:
+    """
+    :param result: the result of minimize_function
+    :param int n_params: the number of the parameters
+    :return np.ndarray: the fitted parameters, without creating lmfit Parameters for a FitResult
+    """
+    if isinstance(result, FitResult):
+        return result.values
+    return parameter_vector(params=result.params, n_params=n_params)
+
+
+def plain_result(result, param_values: tuple, n_params: int) -> FitResult:
+    """
+    :param result: the result of minimize_function
+    :param tuple param_values: the initial value and the lower bound of the parameters
+    :param int n_params: the number of the parameters
+    :return FitResult: the result on plain arrays, it is cheap to send between processes
+    """
+    if isinstance(result, FitResult):
+        return result
+    return FitResult(values=fit_values(result=result, n_params=n_params), param_values=param_values,
+                     residual=np.asarray(result.residual, dtype=float), nfev=result.nfev,
+                     njev=getattr(result, "njev", 0) or 0, success=bool(result.success),
+                     message=str(getattr(result, "message", "")))
+
+
+def fitted_curve(func_class, result, x) -> np.ndarray:
+    """
+    :param func_class: the fitted func_class
+    :param result: the result of minimize_function
+    :param x: the independent variable
+    :return np.ndarray: the values of the fitted func_class, a registered model is evaluated on the array of its
+    parameters
+    """
+    if isinstance(func_class, Model):
+        return func_class.evaluate(p=fit_values(result=result, n_params=func_class.n_params),
+                                   x=np.asarray(x, dtype=float))
+    return func_class(params=result.params, x=x)
+
+
+def least_squares_fit(model: Model, param_values: tuple, x, data, init_values=None) -> FitResult:
+    """
+    Fits a registered model on plain arrays with its analytic Jacobian, the options are the same as lmfit's.
+    :param Model model: the model
+    :param tuple param_values: the initial value and the lower bound of the parameters
+    :param x: the independent variable
+    :param data: the data to fit
+    :param init_values: the initial values of the parameters, if None param_values[0] is used for every parameter
+    :return FitResult: the result
+    """
+    from scipy.optimize import least_squares
+
+    x = np.asarray(x, dtype=float)
+    data = np.asarray(data, dtype=float)
+    lower = np.full(model.n_params, param_values[1], dtype=float)
+    if init_values is None:
+        init_values = np.full(model.n_params, param_values[0], dtype=float)
+    start = np.maximum(np.asarray(init_values, dtype=float), lower)
+    if model.jacobian(p=start, x=x) is None:
+        jac = "2-point"
+    else:
+        def jac(p):
+            return model.jacobian(p=p, x=x)
+
+    ret = least_squares(lambda p: model.evaluate(p=p, x=x) - data, start, jac=jac, bounds=(lower, np.inf),
+                        max_nfev=4000 * (model.n_params + 1), **SOLVER_OPTIONS)
+    return FitResult(values=ret.x, param_values=param_values, residual=ret.fun, nfev=ret.nfev,
+                     njev=0 if ret.njev is None else ret.njev, success=ret.success, message=ret.message)
+
+
+class MultiStart(NamedTuple):
+    """
+    The settings of the multi-start fittings.
+    The starting vectors are sampled between the lower bound and upper, the loss of every sample is computed in
+    one call and the local solver runs from param_values and from the best samples that are better than its result.
+    """
+    n_samples: int = 256
+    n_starts: int = 3
+    upper: float = None
+    seed: int = 0
+    rtol: float = 1e-6
+
+
+def latin_hypercube(n_samples: int, lower: np.ndarray, upper: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Samples the box with a Latin hypercube, every parameter's range is cut into n_samples strata
+    and every stratum has one sample.
+    :param int n_samples: the number of the samples
+    :param np.ndarray lower: the lower bounds of the parameters
+    :param np.ndarray upper: the upper bounds of the parameters
+    :param np.random.Generator rng: the random generator
+    :return np.ndarray: the samples, shape (n_samples, len(lower))
+    """
+    strata = rng.permuted(np.tile(np.arange(n_samples), (len(lower), 1)), axis=1).T
+    unit = (strata + rng.random(strata.shape)) / n_samples
+    return lower + unit * (upper - lower)
+
+
+def multi_start_fit(model: Model, param_values: tuple, x, data, settings: MultiStart) -> tuple:
+    """
+    Fits a registered model from several starting vectors and keeps the best result.
+    :param Model model: the model
+    :param tuple param_values: the initial value and the lower bound of the parameters
+    :param x: the independent variable
+    :param data: the data to fit
+    :param MultiStart settings: the settings
+    :return tuple: the best FitResult and the record of the fitting, with the chi square from param_values,
+    the best chi square and if the outcome changed
+    """
+    x = np.asarray(x, dtype=float)
+    data = np.asarray(data, dtype=float)
+    lower = np.full(model.n_params, param_values[1], dtype=float)
+    upper = settings.upper if settings.upper is not None else \
+        param_values[1] + 10 * max(1.0, abs(param_values[0] - param_values[1]))
+    samples = latin_hypercube(n_samples=settings.n_samples, lower=lower, upper=np.full(model.n_params, upper),
+                              rng=np.random.default_rng(settings.seed))
+    with np.errstate(all="ignore"):
+        loss = np.sum((model.evaluate(p=samples, x=x) - data) ** 2, axis=1)
+    loss[~np.isfinite(loss)] = np.inf
+    best = np.argsort(loss, kind="stable")[:max(settings.n_starts - 1, 0)]
+
+    default = least_squares_fit(model=model, param_values=param_values, x=x, data=data)
+    result, nfev = default, default.nfev
+    # only the samples that are already better than the converged default can lead to a better minimum
+    for start in samples[best[loss[best] < default.chisqr]]:
+        candidate = least_squares_fit(model=model, param_values=param_values, x=x, data=data, init_values=start)
+        nfev += candidate.nfev
+        if candidate.chisqr < result.chisqr:
+            result = candidate
+    changed = bool(result.chisqr < default.chisqr * (1 - settings.rtol))
+    bad = [diagnose(result=fit, data=data, fitted=model.evaluate(p=fit.values, x=x), n_params=model.n_params,
+                    log=False).bad for fit in (default, result)]
+    record = {"n_points": len(data), "default_chisqr": default.chisqr, "best_chisqr": result.chisqr,
+              "changed": changed, "default_bad": bad[0], "bad": bad[1], "nfev": nfev, "default_nfev": default.nfev}
+    return result, record
+
+
+def minimize_function(func_class, param_values, x, data, init_values=None):
+    """
+    Fits the func_class to the data with least squares.
+    The registered models are fitted on arrays with their analytic Jacobian, other func_classes through lmfit.
+    :param func_class: the func_class that includes the equation of the curve to be fitted
+    :param tuple param_values: the initial value and the lower bound of the parameters
+    :param x: the independent variable
+    :param data: the data to fit
+    :param init_values: the initial values of the parameters, if None param_values[0] is used for every parameter
+    :return tuple: the result of the minimization and its chi square
+    """
+    if isinstance(func_class, Model):
+        result = least_squares_fit(model=func_class, param_values=param_values, x=x, data=data,
+                                   init_values=init_values)
+        return result, result.chisqr
+
+    from lmfit import Minimizer
+
+    def func_min(ps, x_data, dat):
+        model = func_class(params=ps, x=x_data)
+        return model - dat
+
+    params = create_parameters(num_params=func_class.n_params, fit_params=param_values)
+    if init_values is not None:
+        for i, value in enumerate(init_values):
+            params[f"a{i + 1}_param"].value = max(value, param_values[1])
+
+    # do fit, here with least_squares model
+    minner = Minimizer(func_min, params, fcn_args=(x, data))
+    result = minner.minimize(method="least_squares")
+    chi_sqr = result.chisqr
+
+    return result, chi_sqr
+
 
 class LMFit:
-    def __init__(self, data_class: DataManipulator, plotter: Plotter):
+    def __init__(self, data_class: DataManipulator, plotter: Plotter, fit_cache=None, result_store=None,
+                 instrumentation=None, multi_start: MultiStart = None, compare_warm_start: bool = False):
+        """
+        :param DataManipulator data_class: the DataManipulator class
+        :param Plotter plotter: the Plotter class
+        :param FitCache fit_cache: if given, the fittings are saved in it and the saved ones are not repeated
+        :param ResultStore result_store: if given, the saved results are appended to it instead of a JSON file
+        :param Instrumentation instrumentation: if given, the fits and the stages are recorded in it
+        :param MultiStart multi_start: if given, the registered models are fitted from several starting vectors
+        when no initial values are given
+        :param bool compare_warm_start: if true every warm started fit is also fitted from param_values, so the
+        warm start report has the function evaluations saved on the same data
+        """
+        self.fit_cache = fit_cache
+        self.result_store = result_store
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
         self.plotter = plotter
         self.data_class = data_class
         self.data = data_class.data
@@ -24,10 +282,16 @@ class LMFit:
         self.bad_fitting = []
         self.df = pd.DataFrame()
         self.plot_data = {}
+        self.diagnostics = []
+        self.warm_values = {}
+        self.warm_start_log = []
+        self.compare_warm_start = compare_warm_start
+        self.multi_start = multi_start
+        self.multi_start_log = []
 
     def create_lmfit_curve_fit(self, cell_name: str, plot_name: str, range_spike: int, func_class, param_values: tuple,
                                do_all: bool, log: bool, show: bool, name_to_save: str, save: bool,
-                               chosen_cells=None, switch_axes=False):
+                               chosen_cells=None, switch_axes=False, warm_start=False):
         """
         This method makes the curve fitting to the points of the given spike's cells.
         :param save:
@@ -42,6 +306,8 @@ class LMFit:
         :param bool do_all: if true the common dictionary of the cells will be used
         :param bool show: if true the curve fitting will be plotted
         :param bool switch_axes: if true the axes will be inverted
+        :param bool warm_start: if true every spike's fit starts from the previous spike's result,
+        the first spike from the same spike of the previously fitted cell with the same model, axes and cell group
         :return -> pd.DataFrames: the parameters and their values will be shown
         """
         letters = ["a1", "a2", "a3", "a4"]
@@ -56,133 +322,92 @@ class LMFit:
             if cell_name not in self.func_dict[name_to_save]:
                 self.func_dict[name_to_save][cell_name] = dict()
 
-        if cell_name not in self.coeff:
+        if name_to_save not in self.coeff:
             self.coeff[name_to_save] = dict()
 
+        flags = {"log": log, "switch_axes": switch_axes}
+        render = save and self.plotter.renderer is not None
+        layers = []
+        stage = self.instrumentation.stage
+        label = "all" if do_all else str(chosen_cells) if isinstance(chosen_cells, list) else cell_name
+        # the single cells share the warm starts, the groups of the cells have their own
+        group = "all" if do_all else tuple(chosen_cells) if isinstance(chosen_cells, list) else "cell"
+        series = (name_to_save, model_name(func_class), log, switch_axes, group)
         for spike in range(0, range_spike):
             string = f"{spike + 1}.spike"
-            x, data = self.data_class.define_axes(cell_name=cell_name, string=string,
-                                                  do_all=do_all, chosen_cells=chosen_cells,
-                                                  log=log, switch_axes=switch_axes)
-            self.plot_data[cell_name][spike] = {}
+            labels = {"function": "create_lmfit_curve_fit", "model": name_to_save, "cell": label, "spike": string}
+            with stage("prepare", **labels):
+                x, data = self.data_class.define_axes(cell_name=cell_name, string=string,
+                                                      do_all=do_all, chosen_cells=chosen_cells,
+                                                      log=log, switch_axes=switch_axes)
+                self.plot_data[cell_name][spike] = {}
 
-            self.plot_data[cell_name][spike]["x"] = list(x)
-            self.plot_data[cell_name][spike]["data"] = list(data)
+                if self.result_store is not None:
+                    self.plot_data[cell_name][spike]["x"] = x
+                    self.plot_data[cell_name][spike]["data"] = data
+                else:
+                    self.plot_data[cell_name][spike]["x"] = list(x)
+                    self.plot_data[cell_name][spike]["data"] = list(data)
 
-            result, chi_sqr = self.fit_the_function(func_class=func_class, param_values=param_values, x=x, data=data)
+            with stage("fit", **labels):
+                if warm_start:
+                    init_values = self.warm_values.get((*series, string)) if spike == 0 else \
+                        fit_values(result=result, n_params=func_class.n_params)
+                    if init_values is not None and len(init_values) != func_class.n_params:
+                        init_values = None
+                    result, chi_sqr = self.warm_start_fit(func_class=func_class, param_values=param_values, x=x,
+                                                          data=data, init_values=init_values,
+                                                          label=(name_to_save, cell_name, string), flags=flags)
+                    self.warm_values[(*series, string)] = fit_values(result=result, n_params=func_class.n_params)
+                else:
+                    result, chi_sqr = self.fit_the_function(func_class=func_class, param_values=param_values, x=x,
+                                                            data=data, flags=flags)
 
-            final = func_class(params=result.params, x=np.linspace(np.min(x), np.max(x), 201))
+            with stage("diagnose", **labels):
+                final = fitted_curve(func_class=func_class, result=result, x=np.linspace(np.min(x), np.max(x), 201))
 
-            # chi2_stat = np.sum(result.residual ** 2 / func_class(params=result.params, x=x))
-            # chi_square_test_statistic, p_value = stats.chisquare(data, func_class(params=result.params, x=x))
+                # chi2_stat = np.sum(result.residual ** 2 / func_class(params=result.params, x=x))
+                # chi_square_test_statistic, p_value = stats.chisquare(data, func_class(params=result.params, x=x))
 
-            if not do_all and not isinstance(chosen_cells, list):
-                self.func_dict[name_to_save][cell_name][string] = func_class(params=result.params, x=x)
-            else:
-                self.func_dict[name_to_save][string] = func_class(params=result.params, x=x)
+                fitted = fitted_curve(func_class=func_class, result=result, x=x)
+                statistics = diagnose(result=result, data=data, fitted=fitted, n_params=func_class.n_params,
+                                      log=log)
+                self.record_fit(name_to_save=name_to_save, cell_name=cell_name, spike=spike, do_all=do_all,
+                                chosen_cells=chosen_cells, fitted=fitted, statistics=statistics)
 
-            if log:
-                squared_difference = np.sum(
-                    ((10 ** data) - (10 ** func_class(params=result.params, x=x))) ** 2 / len(data))
-            else:
-                squared_difference = np.sum((data - func_class(params=result.params, x=x)) ** 2 / len(data))
-            if not do_all and not isinstance(chosen_cells, list):
-                if cell_name not in self.coeff[name_to_save]:
-                    self.coeff[name_to_save][cell_name] = dict()
-                if string not in self.coeff[name_to_save][cell_name]:
-                    self.coeff[name_to_save][cell_name][string] = dict()
-                # self.coeff[name_to_save][cell_name][string]["params"] = list(result.params.valuesdict().values())
-                self.coeff[name_to_save][cell_name][string]["aic"] = result.aic
-                self.coeff[name_to_save][cell_name][string]["bic"] = result.bic
-                self.coeff[name_to_save][cell_name][string]["p-value"] = 1 - stats.chi2.cdf(chi_sqr, result.nfree)
-                self.coeff[name_to_save][cell_name][string]["squared_diff"] = squared_difference
-                self.coeff[name_to_save][cell_name][string]["r_2"] = r2_score(y_true=data, y_pred=func_class(
-                    params=result.params,
-                    x=x))
-                self.coeff[name_to_save][cell_name][string]["adjusted_r_2"] = 1 - \
-                                                                              (1 - r2_score(y_true=data,
-                                                                                            y_pred=func_class(
-                                                                                                params=result.params,
-                                                                                                x=x))) * \
-                                                                              (len(data) - 1) / (
-                                                                                      len(data) - func_class.n_params - 1)
-                self.coeff[name_to_save][cell_name][string]["RMSE"] = np.sqrt(mean_squared_error(y_true=data,
-                                                                                                 y_pred=func_class(
-                                                                                                     params=result.params,
-                                                                                                     x=x)))
-
-                if self.coeff[name_to_save][cell_name][string]["p-value"] < 0.05 and \
-                        self.coeff[name_to_save][cell_name][string]["r_2"] < 0.6:
-                    append_name = cell_name + str(spike)
-                    self.bad_fitting.append(append_name)
+                df_n = self.show_the_fit_results(df=df_n, num_params=func_class.n_params, result=result,
+                                                 spike=spike)
+                df_params = self.show_the_param_results(df=df_params, num_params=func_class.n_params,
+                                                        name_to_save=name_to_save, range_spike=range_spike,
+                                                        do_all=do_all, cell_name=cell_name, spike=spike,
+                                                        chosen_cells=chosen_cells)
 
-            else:
-                self.coeff[name_to_save][string] = dict()
-                # self.coeff[name_to_save][string]["params"] = list(result.params.valuesdict().values())
-                self.coeff[name_to_save][string]["aic"] = result.aic
-                self.coeff[name_to_save][string]["bic"] = result.bic
-                self.coeff[name_to_save][string]["p-value"] = 1 - stats.chi2.cdf(chi_sqr, result.nfree)
-                self.coeff[name_to_save][string]["squared_diff"] = squared_difference
-                self.coeff[name_to_save][string]["r_2"] = r2_score(y_true=data, y_pred=func_class(
-                    params=result.params,
-                    x=x))
-                self.coeff[name_to_save][string]["adjusted_r_2"] = 1 - \
-                                                                   (1 - r2_score(y_true=data,
-                                                                                 y_pred=func_class(params=result.params,
-                                                                                                   x=x))) * \
-                                                                   (len(data) - 1) / (
-                                                                           len(data) - func_class.n_params - 1)
-                self.coeff[name_to_save][string]["RMSE"] = np.sqrt(mean_squared_error(y_true=data, y_pred=func_class(
-                    params=result.params, x=x)))
-
-                if self.coeff[name_to_save][string]["p-value"] < 0.05 and self.coeff[name_to_save][string]["r_2"] < 0.6:
-                    if do_all is True:
-                        append_name = "all" + str(spike)
-                    else:
-                        append_name = str(chosen_cells) + str(spike)
-                    self.bad_fitting.append(append_name)
-
-            df_n = self.show_the_fit_results(df=df_n, num_params=func_class.n_params, result=result, spike=spike)
-            df_params = self.show_the_param_results(df=df_params, num_params=func_class.n_params,
-                                                    name_to_save=name_to_save, range_spike=range_spike,
-                                                    do_all=do_all, cell_name=cell_name, spike=spike,
-                                                    chosen_cells=chosen_cells)
-
-            if show:
-                if log:
-                    self.plotter.plot_fitted_data(x=x, data=data, final=final, log=log,
-                                                  spike=spike, plot_name=plot_name, range_spike=range_spike)
+            with stage("plot", **labels):
+                if render:
+                    layers.extend(self.plotter.fitted_data_layers(x=x, data=data, final=final, log=log,
+                                                                  spike=spike))
+                if show:
+                    if log:
+                        self.plotter.plot_fitted_data(x=x, data=data, final=final, log=log,
+                                                      spike=spike, plot_name=plot_name, range_spike=range_spike,
+                                                      max_points=self.plotter.max_points, lod=self.plotter.lod)
 
+                    else:
+                        self.plotter.plot_fitted_data(x=x, data=data, final=final, log=log,
+                                                      spike=spike, plot_name=plot_name, range_spike=range_spike,
+                                                      max_points=self.plotter.max_points, lod=self.plotter.lod)
                 else:
-                    self.plotter.plot_fitted_data(x=x, data=data, final=final, log=log,
-                                                  spike=spike, plot_name=plot_name, range_spike=range_spike)
-            else:
-                pass
+                    pass
         if show:
+            import matplotlib.pyplot as plt
+
             plt.legend()
         if save:
-            param_name = plot_name + "_" + str(func_class.n_params)
-            file_param = "../generated/" + param_name
-            plt.savefig(f"{file_param}.png")
-            df_n_json = df_n.to_dict()
-            df_params_json = df_params.to_dict()
-            plotted_data = self.plot_data[cell_name]
-
-            out = {'arguments of the function': {"cell_name": cell_name, "func_class": str(func_class),
-                                                 'param_values': param_values, "chosen_cells": chosen_cells,
-                                                 "do_all": do_all, "name_to_save": name_to_save},
-                   'df_n': df_n_json,
-                   'df_params': df_params_json,
-                   'plotted_data': plotted_data
-                   }
-
-            # evaluat = "evaluate" + plot_name + str(func_class.n_params) + '.xlsx'
-            # file_eval = "../generated/" + evaluat
-            # df_n.to_excel(file_param)
-            # df_params.to_excel(file_eval)
-            out_file = open(f"{file_param}.json", "w")
-            json.dump(out, out_file, indent=6)
-            out_file.close()
+            with stage("save", function="create_lmfit_curve_fit", model=name_to_save, cell=label):
+                self.save_curve_fit(cell_name=cell_name, plot_name=plot_name, func_class=func_class,
+                                    param_values=param_values, do_all=do_all, log=log, name_to_save=name_to_save,
+                                    chosen_cells=chosen_cells, switch_axes=switch_axes, df_n=df_n,
+                                    df_params=df_params, layers=layers if render else None, label=label)
         if show:
             with pd.option_context('display.max_rows', None,
                                    'display.max_columns', None,
@@ -191,35 +416,222 @@ class LMFit:
                 print(df_params)
             return df_n
 
-    def fit_the_function(self, func_class, param_values, x, data):
+    def save_curve_fit(self, cell_name: str, plot_name: str, func_class, param_values: tuple, do_all: bool, log: bool,
+                       name_to_save: str, chosen_cells, switch_axes: bool, df_n: pd.DataFrame,
+                       df_params: pd.DataFrame, layers: list, label: str) -> None:
+        """
+        Saves the figure and the results of create_lmfit_curve_fit.
+        :param list layers: the layers of the figure for the renderer, None saves the current pyplot figure
+        :param str label: the name of the fitted cells, as in bad_fitting
+        """
+        param_name = plot_name + "_" + str(func_class.n_params)
+        file_param = "../generated/" + param_name
+        if layers is not None:
+            self.plotter.renderer.submit(self.plotter.fitted_data_spec(path=f"{file_param}.png", layers=layers,
+                                                                       log=log, plot_name=plot_name,
+                                                                       max_points=self.plotter.max_points,
+                                                                       lod=self.plotter.lod))
+        else:
+            import matplotlib.pyplot as plt
+
+            plt.savefig(f"{file_param}.png")
+        if self.result_store is not None:
+            metadata = {"cell_name": cell_name, "func_class": str(func_class), "param_values": list(param_values),
+                        "chosen_cells": chosen_cells, "do_all": do_all, "name_to_save": name_to_save,
+                        "plot_name": plot_name, "log": log, "switch_axes": switch_axes,
+                        "n_params": func_class.n_params, "solver": SOLVER_OPTIONS}
+            self.result_store.append(tables=fit_tables(model=name_to_save, cell=label, df_n=df_n,
+                                                       df_params=df_params, points=self.plot_data[cell_name]),
+                                     metadata=metadata)
+            return
+        df_n_json = df_n.to_dict()
+        df_params_json = df_params.to_dict()
+        plotted_data = self.plot_data[cell_name]
+
+        out = {'arguments of the function': {"cell_name": cell_name, "func_class": str(func_class),
+                                             'param_values': param_values, "chosen_cells": chosen_cells,
+                                             "do_all": do_all, "name_to_save": name_to_save},
+               'df_n': df_n_json,
+               'df_params': df_params_json,
+               'plotted_data': plotted_data
+               }
 
-        def func_min(ps, x_data, dat):
-            model = func_class(params=ps, x=x_data)
-            return model - dat
+        # evaluat = "evaluate" + plot_name + str(func_class.n_params) + '.xlsx'
+        # file_eval = "../generated/" + evaluat
+        # df_n.to_excel(file_param)
+        # df_params.to_excel(file_eval)
+        out_file = open(f"{file_param}.json", "w")
+        json.dump(out, out_file, indent=6)
+        out_file.close()
 
-        params = self.create_parameters(num_params=func_class.n_params, fit_params=param_values)
+    def record_fit(self, name_to_save: str, cell_name: str, spike: int, do_all: bool, chosen_cells, fitted,
+                   statistics: FitDiagnostics) -> None:
+        """
+        Saves the fitted values and the statistics of a spike's fit and marks the bad fittings.
+        :param str name_to_save: the name of the fitting
+        :param str cell_name: the name of the cell
+        :param int spike: the index of the spike, starting from 0
+        :param bool do_all: if true the common dictionary of the cells was fitted
+        :param chosen_cells: if it is a list, the common dictionary of these cells was fitted
+        :param fitted: the values of the fitted function at the points
+        :param FitDiagnostics statistics: the statistics of the fit
+        """
+        string = f"{spike + 1}.spike"
+        self.func_dict.setdefault(name_to_save, dict())
+        self.coeff.setdefault(name_to_save, dict())
+        if not do_all and not isinstance(chosen_cells, list):
+            self.func_dict[name_to_save].setdefault(cell_name, dict())[string] = fitted
+            self.coeff[name_to_save].setdefault(cell_name, dict())[string] = statistics.as_dict()
+            label = cell_name
+            append_name = cell_name + str(spike)
+        else:
+            self.func_dict[name_to_save][string] = fitted
+            self.coeff[name_to_save][string] = statistics.as_dict()
+            if do_all is True:
+                label = "all"
+                append_name = "all" + str(spike)
+            else:
+                label = str(chosen_cells)
+                append_name = str(chosen_cells) + str(spike)
+        self.diagnostics.append(({"name_to_save": name_to_save, "cell": label, "spike": string}, statistics))
+        if statistics.bad:
+            self.bad_fitting.append(append_name)
 
-        # do fit, here with least_squares model
-        minner = Minimizer(func_min, params, fcn_args=(x, data))
-        result = minner.minimize(method="least_squares")
-        chi_sqr = result.chisqr
+    def diagnostics_table(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the statistics of every recorded fit, one row for each
+        """
+        return diagnostics_frame(rows=self.diagnostics)
 
+    def fit_the_function(self, func_class, param_values, x, data, init_values=None, flags: dict = None):
+        """
+        Fits the func_class to the data, through the fit cache if there is one.
+        :param dict flags: the settings the data was made with, they are part of the key of the cache
+        :return tuple: the result of the minimization and its chi square
+        """
+        if not self.instrumentation.enabled:
+            return self.cached_fit(func_class=func_class, param_values=param_values, x=x, data=data,
+                                   init_values=init_values, flags=flags)[:2]
+        start = time.perf_counter()
+        result, chi_sqr, cached = self.cached_fit(func_class=func_class, param_values=param_values, x=x, data=data,
+                                                  init_values=init_values, flags=flags)
+        self.instrumentation.record_fit(seconds=time.perf_counter() - start, func_class=model_name(func_class),
+                                        n_points=len(data), nfev=result.nfev, success=bool(result.success),
+                                        message=str(getattr(result, "message", "")), warm=init_values is not None,
+                                        cached=cached, chisqr=chi_sqr)
         return result, chi_sqr
 
+    def cache_key(self, func_class, param_values, x, data, init_values=None, flags: dict = None):
+        """
+        :return str: the key of the fitting in the fit cache, None if there is no fit cache
+        """
+        if self.fit_cache is None:
+            return None
+        if self.multi_start is not None:
+            flags = {**(flags or {}), "multi_start": list(self.multi_start)}
+        return self.fit_cache.key(func_class=func_class, param_values=param_values, x=x, data=data,
+                                  init_values=init_values, flags=flags)
+
+    def cached_fit(self, func_class, param_values, x, data, init_values=None, flags: dict = None) -> tuple:
+        """
+        :return tuple: the result of the minimization, its chi square and true if it was read from the fit cache
+        """
+        if self.fit_cache is None:
+            result, chi_sqr = self.minimize(func_class=func_class, param_values=param_values, x=x, data=data,
+                                            init_values=init_values)
+            return result, chi_sqr, False
+        key = self.cache_key(func_class=func_class, param_values=param_values, x=x, data=data,
+                             init_values=init_values, flags=flags)
+        result = self.fit_cache.get(key=key, param_values=param_values)
+        cached = result is not None
+        if result is None:
+            result, _ = self.minimize(func_class=func_class, param_values=param_values, x=x, data=data,
+                                      init_values=init_values)
+            self.fit_cache.put(key=key, result=result, n_params=func_class.n_params)
+        return result, result.chisqr, cached
+
+    def minimize(self, func_class, param_values, x, data, init_values=None) -> tuple:
+        """
+        Fits with minimize_function, or from several starting vectors if multi_start is set, the func_class is a
+        registered model and no initial values are given. The multi-start fittings are logged in multi_start_log.
+        :return tuple: the result of the minimization and its chi square
+        """
+        if self.multi_start is None or init_values is not None or not isinstance(func_class, Model):
+            return minimize_function(func_class=func_class, param_values=param_values, x=x, data=data,
+                                     init_values=init_values)
+        result, record = multi_start_fit(model=func_class, param_values=param_values, x=x, data=data,
+                                         settings=self.multi_start)
+        self.multi_start_log.append({"func_class": model_name(func_class), **record})
+        return result, result.chisqr
+
+    def multi_start_report(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the multi-start fittings, and how often they changed the outcome and rescued a bad
+        fitting
+        """
+        table = pd.DataFrame(self.multi_start_log)
+        if table.empty:
+            return table
+        summary = table.groupby("func_class").agg(fits=("changed", "size"), changed=("changed", "sum"),
+                                                  default_bad=("default_bad", "sum"), bad=("bad", "sum"),
+                                                  nfev=("nfev", "sum"), default_nfev=("default_nfev", "sum"))
+        summary["changed_rate"] = summary["changed"] / summary["fits"]
+        return summary
+
+    def warm_start_fit(self, func_class, param_values, x, data, init_values, label, flags: dict = None) -> tuple:
+        """
+        Fits from the converged parameters of a neighbouring fit, the fit is repeated from param_values
+        if it diverges. The number of the function evaluations is logged in warm_start_log. The saving is
+        measured against the fit of the same data from param_values: it is known if the fit was started or
+        repeated from param_values, otherwise only with compare_warm_start, else it is NaN.
+        :param func_class: the func_class that includes the equation of the curve to be fitted
+        :param tuple param_values: the initial value and the lower bound of the parameters
+        :param x: the independent variable
+        :param data: the data to fit
+        :param init_values: the parameters of the neighbouring fit, if None param_values is used
+        :param label: the name of the fit in the log
+        :param dict flags: the settings the data was made with, for the fit cache
+        :return tuple: the result of the minimization and its chi square
+        """
+        fallback = False
+        if init_values is not None:
+            result, chi_sqr = self.fit_the_function(func_class=func_class, param_values=param_values, x=x,
+                                                    data=data, init_values=init_values, flags=flags)
+            nfev = result.nfev
+            values = fit_values(result=result, n_params=func_class.n_params)
+            if not result.success or not np.isfinite(chi_sqr) or not np.all(np.isfinite(values)):
+                fallback = True
+        if init_values is None or fallback:
+            result, chi_sqr = self.fit_the_function(func_class=func_class, param_values=param_values, x=x,
+                                                    data=data, flags=flags)
+            cold_nfev = result.nfev
+            nfev = result.nfev + (nfev if fallback else 0)
+        elif self.compare_warm_start:
+            # it is only measured, so it is not saved in the fit cache or the instrumentation
+            cold_nfev = minimize_function(func_class=func_class, param_values=param_values, x=x, data=data)[0].nfev
+        else:
+            cold_nfev = np.nan
+        self.warm_start_log.append({"fit": label, "warm": init_values is not None, "fallback": fallback,
+                                    "nfev": nfev, "cold_nfev": cold_nfev, "nfev_saved": cold_nfev - nfev})
+        return result, chi_sqr
+
+    def warm_start_report(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the function evaluations of the warm started fits, cold_nfev is the number of
+        the evaluations from param_values on the same data and nfev_saved is the difference
+        """
+        return pd.DataFrame(self.warm_start_log)
+
     @staticmethod
-    def create_parameters(num_params: int, fit_params: tuple) -> Parameters:
-        parameters = Parameters()
-        for i in range(num_params):
-            string = f"a{i + 1}_param"
-            parameters.add(string, value=fit_params[0], min=fit_params[1])
-        return parameters
+    def create_parameters(num_params: int, fit_params: tuple) -> "Parameters":
+        return create_parameters(num_params=num_params, fit_params=fit_params)
 
     @staticmethod
     def show_the_fit_results(df: pd.DataFrame, num_params: int, result, spike: int) -> pd.DataFrame:
         letters = ["a1", "a2", "a3", "a4"]
+        values = fit_values(result=result, n_params=num_params)
         for i in range(num_params):
-            string = f"a{i + 1}_param"
-            df.loc[spike + 1, letters[i]] = result.params.valuesdict()[string]
+            df.loc[spike + 1, letters[i]] = values[i]
         return df
 
     def show_the_param_results(self, df: pd.DataFrame, num_params: int, name_to_save, range_spike, do_all, cell_name,
@@ -0,0 +1,131 @@
+import time
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+
+from src.diagnostics import diagnose
+from src.lm_fit import LMFit, fit_values, fitted_curve
+from src.models import model_name
+
+# the direction of the criteria, true if the larger value is the better
+CRITERIA = {"aic": False, "bic": False, "adjusted_r_2": True}
+
+
+def adjusted_r_2_above(threshold: float):
+    """
+    An early stopping rule, a model is adequate if its adjusted R squared reaches the threshold.
+    :param float threshold: the smallest adequate adjusted R squared
+    :return: the rule, it gets the FitDiagnostics of a fitting
+    """
+    def adequate(statistics) -> bool:
+        return bool(statistics.adjusted_r_2 >= threshold)
+
+    return adequate
+
+
+def rmse_below(threshold: float):
+    """
+    An early stopping rule, a model is adequate if its RMSE is at most the threshold.
+    :param float threshold: the largest adequate RMSE
+    :return: the rule, it gets the FitDiagnostics of a fitting
+    """
+    def adequate(statistics) -> bool:
+        return bool(statistics.rmse <= threshold)
+
+    return adequate
+
+
+def rank_models(table: pd.DataFrame, criterion: str) -> pd.DataFrame:
+    """
+    Ranks the models of every cell and spike, the best is 1.
+    :param pd.DataFrame table: the fittings, with cell, spike and the criterion columns
+    :param str criterion: aic, bic or adjusted_r_2
+    :return pd.DataFrame: the table with the rank and the distance from the best value of the criterion
+    """
+    larger = CRITERIA[criterion]
+    score = table[criterion].astype(float)
+    if criterion == "adjusted_r_2":
+        # it is not defined without more points than parameters + 1, these models are ranked last
+        score = score.where(table["n_points"] > table["n_params"] + 1)
+    groups = score.groupby([table["cell"], table["spike"]], sort=False)
+    table["rank"] = groups.rank(method="min", ascending=not larger, na_option="bottom").astype(int)
+    table["delta"] = (groups.transform("max" if larger else "min") - score).abs()
+    return table
+
+
+class ModelSelector:
+    """
+    Compares func_classes on the same spikes: the data of a spike is prepared once and every candidate is fitted
+    on it. The candidates are fitted from the fewest parameters, and the larger ones can be skipped when a
+    smaller one is already adequate.
+    """
+
+    def __init__(self, lm_fit: LMFit) -> None:
+        """
+        :param LMFit lm_fit: the fittings go through its fit cache and instrumentation
+        """
+        self.lm_fit = lm_fit
+        self.data_class = lm_fit.data_class
+
+    def compare(self, cell_name: str, range_spike: int, func_classes: list, param_values: tuple, do_all: bool = False,
+                chosen_cells=None, log: bool = True, switch_axes: bool = False, criterion: str = "aic",
+                adequate=None) -> pd.DataFrame:
+        """
+        :param str cell_name: the name of the cell
+        :param int range_spike: the number of the spikes to compare the models on, starting from the first
+        :param list func_classes: the candidate func_classes
+        :param tuple param_values: the initial value and the lower bound of the parameters
+        :param bool do_all: if true the points of all cells are fitted
+        :param chosen_cells: if it is a list, the points of these cells are fitted
+        :param bool log: if true the logarithm of the data is fitted
+        :param bool switch_axes: if true IF is the independent variable
+        :param str criterion: aic, bic or adjusted_r_2, the models are ranked by it
+        :param adequate: the early stopping rule, for example adjusted_r_2_above(0.9), the models with more
+        parameters than the first adequate one are not fitted
+        :return pd.DataFrame: one row for every fitted model of every spike, with the parameters, the statistics
+        and the rank
+        """
+        if criterion not in CRITERIA:
+            raise ValueError(f"The criterion has to be one of {list(CRITERIA)}.")
+        candidates = sorted(func_classes, key=lambda func_class: func_class.n_params)
+        n_columns = max(func_class.n_params for func_class in candidates)
+        flags = {"log": log, "switch_axes": switch_axes}
+        label = "all" if do_all else str(chosen_cells) if isinstance(chosen_cells, list) else cell_name
+        stage = self.lm_fit.instrumentation.stage
+        rows = []
+        for spike in range(1, range_spike + 1):
+            string = f"{spike}.spike"
+            with stage("prepare", function="compare", cell=label, spike=string):
+                x, data = self.data_class.define_axes(cell_name=cell_name, string=string, do_all=do_all,
+                                                      chosen_cells=chosen_cells, log=log, switch_axes=switch_axes)
+            stop = None
+            for func_class in candidates:
+                if stop is not None and func_class.n_params > stop:
+                    break
+                name = model_name(func_class)
+                with stage("fit", function="compare", model=name, cell=label, spike=string):
+                    start = time.perf_counter()
+                    result, _ = self.lm_fit.fit_the_function(func_class=func_class, param_values=param_values,
+                                                             x=x, data=data, flags=flags)
+                    seconds = time.perf_counter() - start
+                values = fit_values(result=result, n_params=func_class.n_params)
+                fitted = fitted_curve(func_class=func_class, result=result, x=x)
+                statistics = diagnose(result=result, data=data, fitted=fitted, n_params=func_class.n_params, log=log)
+                rows.append({"cell": label, "spike": string, "model": name,
+                             **{f"a{i + 1}": values[i] if i < len(values) else np.nan for i in range(n_columns)},
+                             **asdict(statistics), "nfev": result.nfev, "success": bool(result.success),
+                             "seconds": seconds})
+                if adequate is not None and stop is None and adequate(statistics):
+                    stop = func_class.n_params
+        if not rows:
+            return pd.DataFrame()
+        return rank_models(table=pd.DataFrame(rows), criterion=criterion)
+
+    @staticmethod
+    def best_models(table: pd.DataFrame) -> pd.DataFrame:
+        """
+        :param pd.DataFrame table: the result of compare
+        :return pd.DataFrame: the best model of every cell and spike
+        """
+        return table[table["rank"] == 1].drop_duplicates(subset=["cell", "spike"]).reset_index(drop=True)
@@ -0,0 +1,161 @@
+import numpy as np
+
+MODELS = {}
+
+
+def register_model(model_class):
+    """
+    Registers an instance of the model class under its name, it can be used as a decorator.
+    :param model_class: the subclass of Model
+    :return: the model class
+    """
+    model = model_class()
+    MODELS[model.name] = model
+    return model_class
+
+
+def get_model(name: str):
+    """
+    :param str name: the name of the registered model
+    :return Model: the model, it can be used as a func_class
+    """
+    return MODELS[name]
+
+
+def parameter_vector(params, n_params: int) -> np.ndarray:
+    """
+    Converts the parameters of a fit to an array.
+    :param params: lmfit Parameters with the names a1_param, a2_param, ... or an array
+    :param int n_params: the number of the parameters
+    :return np.ndarray: the values of the parameters
+    """
+    if hasattr(params, "valuesdict"):
+        return np.array([params[f"a{i + 1}_param"].value for i in range(n_params)], dtype=float)
+    return np.asarray(params, dtype=float)
+
+
+def model_name(func_class) -> str:
+    """
+    :param func_class: a Model or a function with the n_params attribute
+    :return str: the name of the model or of the function
+    """
+    return getattr(func_class, "name", None) or getattr(func_class, "__name__", type(func_class).__name__)
+
+
+class Model:
+    """
+    An IF - relative firing time model that is evaluated on plain NumPy parameter vectors.
+    The instances can be used as func_class: model(params=..., x=...) accepts lmfit Parameters too.
+    The parameters are on the last axis of p, so a batch of parameter vectors can be evaluated at once.
+    A linear model is linear in its parameters, its values are jacobian(p, x) @ p for any p.
+    """
+    name = None
+    n_params = 0
+    version = 1
+    linear = False
+
+    def __call__(self, params, x) -> np.ndarray:
+        return self.evaluate(p=parameter_vector(params=params, n_params=self.n_params),
+                             x=np.asarray(x, dtype=float))
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def evaluate(self, p: np.ndarray, x: np.ndarray) -> np.ndarray:
+        """
+        :param np.ndarray p: the parameters, shape (n_params,) or (batch, n_params)
+        :param np.ndarray x: the independent variable
+        :return np.ndarray: the values of the model, shape (len(x),) or (batch, len(x))
+        """
+        raise NotImplementedError
+
+    def jacobian(self, p: np.ndarray, x: np.ndarray):
+        """
+        :param np.ndarray p: the parameters, shape (n_params,)
+        :param np.ndarray x: the independent variable
+        :return: the derivatives by the parameters, shape (len(x), n_params), None if it is not known analytically
+        """
+        return None
+
+
+@register_model
+class Inverse(Model):
+    """
+    a1 / x
+    """
+    name = "inverse"
+    n_params = 1
+    linear = True
+
+    def evaluate(self, p, x):
+        return p[..., 0, None] / x
+
+    def jacobian(self, p, x):
+        return (1 / x)[:, None]
+
+
+@register_model
+class LogLinear(Model):
+    """
+    a1 - a2 * x, a power law in log-log space
+    """
+    name = "log_linear"
+    n_params = 2
+    linear = True
+
+    def evaluate(self, p, x):
+        return p[..., 0, None] - p[..., 1, None] * x
+
+    def jacobian(self, p, x):
+        return np.column_stack((np.ones_like(x), -x))
+
+
+@register_model
+class PowerLaw(Model):
+    """
+    a1 * x ** -a2
+    """
+    name = "power_law"
+    n_params = 2
+
+    def evaluate(self, p, x):
+        return p[..., 0, None] * x ** -p[..., 1, None]
+
+    def jacobian(self, p, x):
+        power = x ** -p[1]
+        return np.column_stack((power, -p[0] * power * np.log(x)))
+
+
+@register_model
+class ExponentialOffset(Model):
+    """
+    a1 * exp(-a2 * x) + a3
+    """
+    name = "exponential_offset"
+    n_params = 3
+
+    def evaluate(self, p, x):
+        return p[..., 0, None] * np.exp(-p[..., 1, None] * x) + p[..., 2, None]
+
+    def jacobian(self, p, x):
+        decay = np.exp(-p[1] * x)
+        return np.column_stack((decay, -p[0] * x * decay, np.ones_like(x)))
+
+
+@register_model
+class DoubleExponential(Model):
+    """
+    a1 * exp(-a2 * x) + a3 * exp(-(a2 + a4) * x)
+    The second rate is given by its difference, so the two terms can not swap
+    even though every parameter starts from the same value.
+    """
+    name = "double_exponential"
+    n_params = 4
+
+    def evaluate(self, p, x):
+        return p[..., 0, None] * np.exp(-p[..., 1, None] * x) + \
+            p[..., 2, None] * np.exp(-(p[..., 1, None] + p[..., 3, None]) * x)
+
+    def jacobian(self, p, x):
+        slow, fast = np.exp(-p[1] * x), np.exp(-(p[1] + p[3]) * x)
+        return np.column_stack((slow, -x * (p[0] * slow + p[2] * fast), fast, -p[2] * x * fast))
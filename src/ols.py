@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def sufficient_statistics(x, y, shift: tuple = (0.0, 0.0)) -> dict:
+    """
+    Computes the sums of a simple linear regression.
+    :param x: the independent variable
+    :param y: the dependent variable
+    :param tuple shift: subtracted from x and y before summing, for numerical stability
+    :return dict: n, sx, sy, sxx, sxy, syy
+    """
+    x = np.asarray(x, dtype=float) - shift[0]
+    y = np.asarray(y, dtype=float) - shift[1]
+    return {"n": len(x), "sx": x.sum(), "sy": y.sum(), "sxx": x @ x, "sxy": x @ y, "syy": y @ y}
+
+
+def prefix_statistics(x, y, order: np.ndarray, counts, shift: tuple = (0.0, 0.0)) -> dict:
+    """
+    Computes the sums of the first points in the given order for many subsets at once.
+    :param x: the independent variable
+    :param y: the dependent variable
+    :param np.ndarray order: the order the points are admitted in
+    :param counts: the number of the admitted points of every subset
+    :param tuple shift: subtracted from x and y before summing, for numerical stability
+    :return dict: n, sx, sy, sxx, sxy, syy as arrays over the subsets
+    """
+    x = np.asarray(x, dtype=float)[order] - shift[0]
+    y = np.asarray(y, dtype=float)[order] - shift[1]
+    counts = np.asarray(counts)
+    sums = {}
+    for key, values in (("sx", x), ("sy", y), ("sxx", x * x), ("sxy", x * y), ("syy", y * y)):
+        sums[key] = np.concatenate(([0.0], np.cumsum(values)))[counts]
+    sums["n"] = counts
+    return sums
+
+
+def ols_from_sums(n, sx, sy, sxx, sxy, syy, shift: tuple = (0.0, 0.0), alpha: float = 0.05) -> dict:
+    """
+    Computes the results of y = const + slope * x from the sums, for one or many subsets.
+    The values are the same as statsmodels' OLS with a constant.
+    :param n: the number of the points
+    :param sx: the sum of x
+    :param sy: the sum of y
+    :param sxx: the sum of x * x
+    :param sxy: the sum of x * y
+    :param syy: the sum of y * y
+    :param tuple shift: the shift the sums were computed with
+    :param float alpha: the significance level of the confidence intervals
+    :return dict: params, bse, pvalues, conf_int (shape (..., 2) and (..., 2, 2)), rsquared, fvalue, f_pvalue
+    """
+    from scipy import stats
+
+    n = np.asarray(n, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x, mean_y = sx / n, sy / n
+        s_xx = sxx - sx * mean_x
+        s_xy = sxy - sx * mean_y
+        s_yy = syy - sy * mean_y
+        slope = s_xy / s_xx
+        const = mean_y - slope * mean_x
+        df_resid = n - 2
+        ssr = np.maximum(s_yy - slope * s_xy, 0.0)
+        scale = ssr / df_resid
+        params = np.stack((const + shift[1] - slope * shift[0], slope), axis=-1)
+        bse = np.stack((np.sqrt(scale * (1 / n + (mean_x + shift[0]) ** 2 / s_xx)), np.sqrt(scale / s_xx)),
+                       axis=-1)
+        tvalues = params / bse
+        pvalues = 2 * stats.t.sf(np.abs(tvalues), df_resid[..., None])
+        q = stats.t.ppf(1 - alpha / 2, df_resid)[..., None]
+        conf_int = np.stack((params - q * bse, params + q * bse), axis=-1)
+        rsquared = 1 - ssr / s_yy
+        fvalue = (s_yy - ssr) / scale
+        f_pvalue = stats.f.sf(fvalue, 1, df_resid)
+    return {"params": params, "bse": bse, "pvalues": pvalues, "conf_int": conf_int, "rsquared": rsquared,
+            "fvalue": fvalue, "f_pvalue": f_pvalue}
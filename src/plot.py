@@ -1,11 +1,11 @@
 from random import random
 import random
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
 
 from src.datamanipulator import DataManipulator
+from src.render import Layer, Panel, PlotSpec, Renderer, draw_points
 
 
 def plot_frame_spike(name: str, spike_frame: pd.DataFrame, color: str) -> None:
@@ -15,6 +15,8 @@ def plot_frame_spike(name: str, spike_frame: pd.DataFrame, color: str) -> None:
     :param pd.DataFrame spike_frame: the dataframe
     :param str color: the color of the plot
     """
+    import matplotlib.pyplot as plt
+
     plt.scatter(spike_frame["relative firing time"], spike_frame["IF"],
                 c=color)
     plt.title(name)
@@ -27,37 +29,38 @@ class Plotter:
     """
     This class plots the data.
     """
-    def __init__(self, data_class: DataManipulator):
+    def __init__(self, data_class: DataManipulator, renderer: Renderer = None, max_points: int = 20000,
+                 lod: str = "density"):
         """
         :param DataManipulator data_class: the DataManipulator class
+        :param Renderer renderer: if given the saved figures are rendered by it in the background
+        :param int max_points: above this number of points the scatter plots are drawn with a level of detail,
+        None switches it off
+        :param str lod: "density" for a 2D histogram, "raster" for rasterized markers
         """
         self.data_class = data_class
+        self.renderer = renderer
+        self.max_points = max_points
+        self.lod = lod
         self.data = data_class.data
         self.dict = data_class.dict
         self.names = data_class.names
 
-    def plot_spike(self, name: str, spike_name: str, color: str, all: bool, chosen_cells: list) -> None:
+    def plot_spike(self, name: str, spike_name: str, color: str, all: bool, chosen_cells: list = None) -> None:
         """
         This method plots relative firing time and IF of the given cell's spike.
         :param str name: the name of the cell
         :param str spike_name: the number of the spike, for example "1.spike"
         :param str color: the color of the plot
         :param bool all: if true the common dict from all the cells will be plotted, if false the given cell
+        :param list chosen_cells: if it is a list, the common dict of these cells will be plotted
         """
-        if all:
-            all_dict = self.data_class.all_in_one_dict
-            plt.scatter(all_dict[spike_name]["relative firing time"],
-                        all_dict[spike_name]["IF"], c=color)
-            plt.ylim(0, 400)
-        elif isinstance(chosen_cells, list):
-            all_dict = self.data_class.all_in_one_dict_creating(gbz_dict=self.data_class.choose_cells, chosen_cells=chosen_cells)
-            plt.scatter(all_dict[spike_name]["relative firing time"],
-                        all_dict[spike_name]["IF"], c=color)
-            plt.ylim(0, 400)
-        else:
-            plt.scatter(self.dict[name][spike_name]["relative firing time"],
-                        self.dict[name][spike_name]["IF"], c=color)
-            plt.ylim(0, 400)
+        import matplotlib.pyplot as plt
+
+        times, ifs = self.data_class.spike_points(cell_name=name, spike=spike_name, do_all=all,
+                                                  chosen_cells=chosen_cells)
+        draw_points(ax=plt.gca(), x=times, y=ifs, color=color, max_points=self.max_points, lod=self.lod)
+        plt.ylim(0, 400)
         if all:
             plt.title("All spikes")
         else:
@@ -73,18 +76,20 @@ class Plotter:
         """
         color = ["#" + ''.join([random.choice('0123456789ABCDEF') for j in range(6)])
                  for i in range(len(self.dict[cell_name]))]
-        for i in range(1, len(self.dict[cell_name]) + 1):
-            spike = f"{i}.spike"
-            self.plot_spike(name=cell_name, spike_name=spike, color=color[i - 1], all=False)
+        for i, spike in enumerate(self.dict[cell_name]):
+            self.plot_spike(name=cell_name, spike_name=spike, color=color[i], all=False)
 
     @staticmethod
-    def plot_fitted_data(x, data, final, log, spike, plot_name, range_spike):
+    def plot_fitted_data(x, data, final, log, spike, plot_name, range_spike, max_points=None, lod="density"):
+        import matplotlib.pyplot as plt
+
         colors = ["#"+''.join([random.choice('0123456789ABCDEF') for j in range(6)])for i in range(range_spike)]
         function_colors = ["#"+''.join([random.choice('0123456789ABCDEF') for j in range(6)])for i in range(range_spike)]
         if log:
             plt.xscale('log')
             plt.yscale('log')
-            plt.plot(10 ** x, 10 ** data, 'o', c=colors[spike], label=f"{spike+1}.spike")
+            draw_points(ax=plt.gca(), x=10 ** x, y=10 ** data, color=colors[spike], label=f"{spike+1}.spike",
+                        marker=True, xscale="log", yscale="log", max_points=max_points, lod=lod)
             plt.plot(10 ** np.linspace(np.min(x), np.max(x), 201),
                      10 ** final,
                      'r', c=colors[spike])
@@ -93,7 +98,8 @@ class Plotter:
             plt.xlabel("relative firing time")
             plt.ylabel("IF")
         else:
-            plt.plot(x, data, 'o', c=colors[spike], label=f"{spike+1}.spike")
+            draw_points(ax=plt.gca(), x=x, y=data, color=colors[spike], label=f"{spike+1}.spike", marker=True,
+                        max_points=max_points, lod=lod)
             plt.plot(np.linspace(np.min(x), np.max(x), 201), final, 'r', c=colors[spike])
             plt.title(plot_name)
             plt.ylim(0, 400)
@@ -102,6 +108,42 @@ class Plotter:
             plt.ylabel("IF")
             # plt.show()
 
+    @staticmethod
+    def fitted_data_layers(x, data, final, log, spike) -> tuple:
+        """
+        Creates the layers drawn by plot_fitted_data.
+        :param x: the x values of the points
+        :param data: the y values of the points
+        :param final: the fitted curve at 201 points between the minimum and the maximum of x
+        :param bool log: if true the values are logarithms and they are drawn on log scales
+        :param int spike: the index of the spike
+        :return tuple: the layers of the points and of the curve
+        """
+        color = f"C{spike % 10}"
+        curve_x = np.linspace(np.min(x), np.max(x), 201)
+        if log:
+            x, data, curve_x, final = 10 ** np.asarray(x), 10 ** np.asarray(data), 10 ** curve_x, \
+                10 ** np.asarray(final)
+        return (Layer(kind="points", x=np.asarray(x), y=np.asarray(data), color=color, label=f"{spike + 1}.spike"),
+                Layer(kind="line", x=curve_x, y=np.asarray(final), color=color))
+
+    @staticmethod
+    def fitted_data_spec(path, layers, log, plot_name, max_points=None, lod="density") -> PlotSpec:
+        """
+        Creates the figure saved by create_lmfit_curve_fit.
+        :param str path: the path of the file
+        :param list layers: the layers of every spike, from fitted_data_layers
+        :param bool log: if true the axes have log scales
+        :param str plot_name: the title of the plot
+        :param int max_points: above this number of points a spike's points are drawn with a level of detail
+        :param str lod: "density" or "raster"
+        :return PlotSpec: the figure
+        """
+        scale = "log" if log else "linear"
+        return PlotSpec(path=path, panels=(Panel(layers=tuple(layers), title=plot_name, xscale=scale, yscale=scale,
+                                                 ylim=(None, 400) if log else (0, 400), legend=True),),
+                        max_points=max_points, lod=lod)
+
     @staticmethod
     def plot_fitted_data_eval(x, data, final, log, plot_name, ax, id):
         colors = ["#"+''.join([random.choice('0123456789ABCDEF') for j in range(6)])for i in range(1)]
@@ -136,6 +178,8 @@ class Plotter:
 
     @staticmethod
     def plot_errors(dictionary: dict, threshold: list, what_to_plot: str, cell_name, spike_name):
+        import matplotlib.pyplot as plt
+
         arang = np.arange(1, len(threshold)+1, 1)
         for i, num in enumerate(threshold):
             plt.plot(arang[i], dictionary[cell_name][spike_name][round(10 ** num)][what_to_plot], "o")
@@ -143,6 +187,8 @@ class Plotter:
 
     @staticmethod
     def plotter_params(cell_name, spike_name, thresholds, dictionary, linear_regression: bool, log:bool):
+        import matplotlib.pyplot as plt
+
         if linear_regression:
             param = ['r_square', 'fp']
         else:
@@ -164,4 +210,35 @@ class Plotter:
         file_path = "../generated/" + f_name
         fig.savefig(file_path)
 
+    @staticmethod
+    def params_spec(cell_name, spike_name, thresholds, dictionary, linear_regression: bool, log: bool) -> PlotSpec:
+        """
+        Creates the figure saved by plotter_params.
+        :param str cell_name: the name of the cell
+        :param str spike_name: the number of the spike, for example "1.spike"
+        :param thresholds: the IF thresholds
+        :param dict dictionary: the results of the fittings, Evaluate.fit_parameters
+        :param bool linear_regression: if true the results of the linear regression are plotted
+        :param bool log: if true the thresholds are logarithms
+        :return PlotSpec: the figure
+        """
+        if linear_regression:
+            param = ['r_square', 'fp']
+        else:
+            param = ["p", "r_2"]
+        if log:
+            threshold = [round(10 ** i) for i in thresholds]
+        else:
+            threshold = [i for i in thresholds]
+        panels = []
+        for key in param:
+            perm_list = [dictionary[cell_name][spike_name][item][key] for item in threshold]
+            panels.append(Panel(layers=(Layer(kind="line", x=np.asarray(threshold), y=np.asarray(perm_list),
+                                              color="C0"),
+                                        Layer(kind="scatter", x=np.asarray(threshold), y=np.asarray(perm_list),
+                                              color="C0")),
+                                title=key, xlabel="", ylabel=""))
+        return PlotSpec(path="../generated/" + cell_name + "_" + spike_name + ".png", panels=tuple(panels),
+                        figsize=(50, 6))
+
 
@@ -0,0 +1,215 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Layer(NamedTuple):
+    """
+    One data series of a panel.
+    The kind is "points" (markers), "line" or "scatter".
+    """
+    kind: str
+    x: np.ndarray
+    y: np.ndarray
+    color: str = None
+    label: str = None
+
+
+class Panel(NamedTuple):
+    """
+    One axes of a figure.
+    """
+    layers: tuple
+    title: str = ""
+    xlabel: str = "relative firing time"
+    ylabel: str = "IF"
+    xscale: str = "linear"
+    yscale: str = "linear"
+    xlim: tuple = None
+    ylim: tuple = None
+    legend: bool = False
+
+
+class PlotSpec(NamedTuple):
+    """
+    Everything needed to draw and save a figure, the panels are placed in one row.
+    Layers with more points than max_points are drawn with the level of detail given by lod, see draw_points.
+    """
+    path: str
+    panels: tuple
+    figsize: tuple = (6.4, 4.8)
+    dpi: int = 100
+    max_points: int = None
+    lod: str = "density"
+
+
+# the figures of a worker process, reused for the specs with the same layout
+_figures = {}
+
+
+def get_figure(n_panels: int, figsize: tuple, dpi: int) -> tuple:
+    """
+    Gives the cleared figure and axes of the layout, created on the first use in the process.
+    :param int n_panels: the number of the axes
+    :param tuple figsize: the size of the figure in inches
+    :param int dpi: the resolution of the figure
+    :return tuple: the figure and the list of the axes
+    """
+    key = (n_panels, tuple(figsize), dpi)
+    if key not in _figures:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(figure)
+        _figures[key] = (figure, list(np.atleast_1d(figure.subplots(nrows=1, ncols=n_panels))))
+    figure, axes = _figures[key]
+    for ax in axes:
+        ax.clear()
+    return figure, axes
+
+
+def draw_points(ax, x, y, color: str = None, label: str = None, marker: bool = False, xscale: str = "linear",
+                yscale: str = "linear", max_points: int = None, lod: str = "density", gridsize: int = 100) -> None:
+    """
+    Draws the points, above max_points with a level of detail that does not depend on their number.
+    The "density" mode draws a hexagonal 2D histogram binned in the scales of the axes, from transparent to the
+    color of the points. The "raster" mode draws small markers as one image.
+    :param ax: the axes to draw on
+    :param x: the x values
+    :param y: the y values
+    :param str color: the color of the points
+    :param str label: the label of the points in the legend
+    :param bool marker: if true the points are drawn like plot(x, y, "o"), otherwise like scatter(x, y)
+    :param str xscale: the scale of the x axis, "linear" or "log"
+    :param str yscale: the scale of the y axis, "linear" or "log"
+    :param int max_points: the number of the points above which the level of detail is used, None switches it off
+    :param str lod: "density" or "raster"
+    :param int gridsize: the number of the hexagons along the x axis in the density mode
+    """
+    if max_points is None or len(x) <= max_points:
+        if marker:
+            ax.plot(x, y, "o", c=color, label=label)
+        else:
+            ax.scatter(x, y, c=color, label=label)
+    elif lod == "raster":
+        ax.scatter(x, y, c=color, label=label, s=4, linewidths=0, rasterized=True)
+    else:
+        from matplotlib.colors import LinearSegmentedColormap, to_rgba
+
+        base = color if color is not None else "C0"
+        cmap = LinearSegmentedColormap.from_list("density", [to_rgba(base, 0.1), to_rgba(base, 1.0)])
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        if xscale == "log" or yscale == "log":
+            keep = ((x > 0) | (xscale != "log")) & ((y > 0) | (yscale != "log"))
+            x, y = x[keep], y[keep]
+        ax.hexbin(x, y, gridsize=gridsize, xscale=xscale, yscale=yscale, bins="log", mincnt=1, cmap=cmap,
+                  label=label)
+
+
+def draw_layer(ax, layer: Layer, xscale: str = "linear", yscale: str = "linear", max_points: int = None,
+               lod: str = "density") -> None:
+    """
+    :param ax: the axes to draw on
+    :param Layer layer: the data series
+    :param str xscale: the scale of the x axis
+    :param str yscale: the scale of the y axis
+    :param int max_points: the number of the points above which the level of detail is used
+    :param str lod: "density" or "raster"
+    """
+    if layer.kind in ("points", "scatter"):
+        draw_points(ax=ax, x=layer.x, y=layer.y, color=layer.color, label=layer.label,
+                    marker=layer.kind == "points", xscale=xscale, yscale=yscale, max_points=max_points, lod=lod)
+    else:
+        ax.plot(layer.x, layer.y, c=layer.color, label=layer.label, zorder=3)
+
+
+def draw_panel(ax, panel: Panel, max_points: int = None, lod: str = "density") -> None:
+    """
+    :param ax: the axes to draw on
+    :param Panel panel: the content of the axes
+    :param int max_points: the number of the points above which the level of detail is used
+    :param str lod: "density" or "raster"
+    """
+    ax.set_xscale(panel.xscale)
+    ax.set_yscale(panel.yscale)
+    for layer in panel.layers:
+        draw_layer(ax=ax, layer=layer, xscale=panel.xscale, yscale=panel.yscale, max_points=max_points, lod=lod)
+    if panel.xlim is not None:
+        ax.set_xlim(*panel.xlim)
+    if panel.ylim is not None:
+        ax.set_ylim(*panel.ylim)
+    ax.set_title(panel.title)
+    ax.set_xlabel(panel.xlabel)
+    ax.set_ylabel(panel.ylabel)
+    if panel.legend:
+        ax.legend()
+
+
+def render_spec(spec: PlotSpec) -> tuple:
+    """
+    Draws and saves a figure on the Agg canvas, without the global state of pyplot.
+    :param PlotSpec spec: the figure
+    :return tuple: the path of the file and the time of the rendering
+    """
+    start = time.perf_counter()
+    figure, axes = get_figure(n_panels=len(spec.panels), figsize=spec.figsize, dpi=spec.dpi)
+    for ax, panel in zip(axes, spec.panels):
+        draw_panel(ax=ax, panel=panel, max_points=spec.max_points, lod=spec.lod)
+    os.makedirs(os.path.dirname(os.path.abspath(spec.path)), exist_ok=True)
+    figure.savefig(spec.path)
+    return spec.path, time.perf_counter() - start
+
+
+class Renderer:
+    """
+    Renders the queued figures in worker processes, so the fitting does not wait for the plotting.
+    The figures are saved in the background, close() waits for all of them.
+    """
+
+    def __init__(self, max_workers: int = None) -> None:
+        """
+        :param int max_workers: the number of the processes, 1 renders in the main process when submitted
+        """
+        self.max_workers = max_workers
+        self.executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers != 1 else None
+        self.futures = []
+        self.rendered = []
+
+    def submit(self, spec: PlotSpec) -> None:
+        """
+        :param PlotSpec spec: the figure to render
+        """
+        if self.executor is None:
+            self.rendered.append(render_spec(spec=spec))
+        else:
+            self.futures.append(self.executor.submit(render_spec, spec))
+
+    def wait(self) -> list:
+        """
+        Waits for the queued figures.
+        :return list: the path and the rendering time of every figure, in the order of the submission
+        """
+        self.rendered.extend(future.result() for future in self.futures)
+        self.futures = []
+        return self.rendered
+
+    def close(self) -> list:
+        """
+        Waits for the queued figures and stops the processes.
+        :return list: the path and the rendering time of every figure, in the order of the submission
+        """
+        rendered = self.wait()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return rendered
+
+    def __enter__(self) -> "Renderer":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
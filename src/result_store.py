@@ -0,0 +1,165 @@
+import datetime
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from src import PROJECT_PATH
+
+KEY_COLUMNS = ("model", "cell", "spike")
+
+
+def fit_tables(model: str, cell: str, df_n: pd.DataFrame, df_params: pd.DataFrame, points: dict) -> dict:
+    """
+    Creates the tables of a create_lmfit_curve_fit run.
+    :param str model: the name the fittings are saved under
+    :param str cell: the name of the fitted cells, as in LMFit.bad_fitting
+    :param pd.DataFrame df_n: the fitted parameters of the spikes
+    :param pd.DataFrame df_params: the statistics of the spikes
+    :param dict points: {index of the spike: {"x": x, "data": data}}, like LMFit.plot_data
+    :return dict: {table: dataframe}
+    """
+    tables = {}
+    for table, frame in (("params", df_n), ("diagnostics", df_params)):
+        keys = pd.DataFrame({"model": model, "cell": cell, "spike": np.asarray(frame.index, dtype=np.int64)})
+        tables[table] = pd.concat([keys, frame.reset_index(drop=True).astype(float)], axis=1)
+    spikes = sorted(points)
+    lengths = [len(points[spike]["x"]) for spike in spikes]
+    tables["points"] = pd.DataFrame({
+        "model": model, "cell": cell, "spike": np.repeat(np.asarray(spikes, dtype=np.int64) + 1, lengths),
+        "x": np.concatenate([np.asarray(points[spike]["x"], dtype=float) for spike in spikes] or [[]]),
+        "data": np.concatenate([np.asarray(points[spike]["data"], dtype=float) for spike in spikes] or [[]])})
+    return tables
+
+
+def read_column(part, name: str, mask: np.ndarray) -> np.ndarray:
+    """
+    :param part: the opened npz file
+    :param str name: the name of the column, with the name of the table
+    :param np.ndarray mask: the rows to read
+    :return np.ndarray: the values of the rows
+    """
+    if f"{name}__codes" in part.files:
+        return part[f"{name}__values"].astype(object)[part[f"{name}__codes"][mask]]
+    return part[name][mask]
+
+
+class ResultStore:
+    """
+    Saves the results of the fittings in binary columnar parts, one part for every run.
+    A part holds the tables params, diagnostics and points, every column is a numpy array in an uncompressed npz file,
+    the string columns are saved as the distinct strings and the positions of the rows' strings among them.
+    Every part has its entry, <run id>.json next to the npz file, with the metadata of the run and the models, cells
+    and spikes it contains. The manifest merges the entries, so a query only opens the parts and reads the columns it
+    needs, and the writers of the parts never rewrite each other's entries.
+    """
+
+    def __init__(self, directory: str = None) -> None:
+        """
+        :param str directory: the folder of the store, by default generated/results in the project
+        """
+        self.directory = directory if directory is not None else os.path.join(PROJECT_PATH, "generated", "results")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def manifest(self) -> list:
+        """
+        :return list: the descriptions of the parts, in the order they were written
+        """
+        entries = []
+        for file in os.listdir(self.directory):
+            if not file.endswith(".json"):
+                continue
+            with open(os.path.join(self.directory, file)) as in_file:
+                entries.append(json.load(in_file))
+        return sorted(entries, key=lambda entry: (entry["created"], entry["run_id"]))
+
+    def append(self, tables: dict, metadata: dict = None) -> str:
+        """
+        Saves the tables of a run as a new part.
+        :param dict tables: {table: dataframe}, the tables need the model, cell and spike columns
+        :param dict metadata: the description of the run, it has to be JSON serializable
+        :return str: the id of the run
+        """
+        run_id = uuid.uuid4().hex
+        arrays, description = {}, {}
+        for table, frame in tables.items():
+            for column in frame.columns:
+                values = frame[column].to_numpy()
+                if values.dtype == object:
+                    # the strings are saved once, the rows refer to them by their position
+                    codes, uniques = pd.factorize(values)
+                    arrays[f"{table}__{column}__codes"] = codes.astype(np.int32)
+                    arrays[f"{table}__{column}__values"] = np.asarray(uniques, dtype=str)
+                else:
+                    arrays[f"{table}__{column}"] = values
+            description[table] = {"columns": [str(column) for column in frame.columns], "rows": len(frame)}
+        file = f"{run_id}.npz"
+        temporary = os.path.join(self.directory, f"{file}.tmp")
+        with open(temporary, "wb") as out_file:
+            np.savez(out_file, **arrays)
+        os.replace(temporary, os.path.join(self.directory, file))
+
+        keys = pd.concat([frame[list(KEY_COLUMNS)] for frame in tables.values()])
+        entry = {"run_id": run_id, "file": file,
+                 "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                 "metadata": metadata or {}, "tables": description,
+                 "models": sorted(set(keys["model"].astype(str))), "cells": sorted(set(keys["cell"].astype(str))),
+                 "spikes": sorted(int(spike) for spike in set(keys["spike"]))}
+        # the entry is written after the part, so the manifest never lists a part that is not complete
+        temporary = os.path.join(self.directory, f"{run_id}.json.tmp")
+        with open(temporary, "w") as out_file:
+            json.dump(entry, out_file)
+        os.replace(temporary, os.path.join(self.directory, f"{run_id}.json"))
+        return run_id
+
+    def runs(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the runs with their metadata, one row for each
+        """
+        return pd.DataFrame([{"run_id": entry["run_id"], "created": entry["created"], **entry["metadata"]}
+                             for entry in self.manifest()])
+
+    def query(self, table: str, model: str = None, cell: str = None, spike: int = None, run_id: str = None,
+              columns: list = None) -> pd.DataFrame:
+        """
+        Reads the rows of a table that match the filters, a None filter matches everything.
+        :param str table: "params", "diagnostics" or "points"
+        :param str model: the name the fittings were saved under
+        :param str cell: the name of the fitted cells
+        :param int spike: the number of the spike, starting from 1
+        :param str run_id: the id of the run
+        :param list columns: the columns to read, by default every column
+        :return pd.DataFrame: the matching rows, with the id of their run
+        """
+        filters = {"model": model, "cell": cell, "spike": spike}
+        frames = []
+        for entry in self.manifest():
+            if table not in entry["tables"] or (run_id is not None and entry["run_id"] != run_id):
+                continue
+            if (model is not None and model not in entry["models"]) or \
+                    (cell is not None and cell not in entry["cells"]) or \
+                    (spike is not None and spike not in entry["spikes"]):
+                continue
+            names = entry["tables"][table]["columns"] if columns is None else list(columns)
+            with np.load(os.path.join(self.directory, entry["file"])) as part:
+                mask = np.ones(entry["tables"][table]["rows"], dtype=bool)
+                for column, value in filters.items():
+                    if value is None:
+                        continue
+                    if f"{table}__{column}__codes" in part.files:
+                        uniques = list(part[f"{table}__{column}__values"])
+                        code = uniques.index(value) if value in uniques else -2
+                        mask &= part[f"{table}__{column}__codes"] == code
+                    else:
+                        mask &= part[f"{table}__{column}"] == value
+                if not mask.any():
+                    continue
+                frame = pd.DataFrame({column: read_column(part=part, name=f"{table}__{column}", mask=mask)
+                                      for column in names})
+            frame.insert(0, "run_id", entry["run_id"])
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
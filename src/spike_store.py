@@ -0,0 +1,175 @@
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+
+def spike_numbers(if_values: np.ndarray, start: int = 0) -> np.ndarray:
+    """
+    Numbers the points of a spike train, the count restarts after every NaN value.
+    :param np.ndarray if_values: the IF values
+    :param int start: the number of the spikes before the first value that belong to its train, used when the
+    values continue a previous column that did not end with NaN
+    :return np.ndarray: the number of the spike for every point, 0 for the NaN values
+    """
+    valid = ~np.isnan(if_values)
+    count = np.cumsum(valid)
+    reset = np.maximum.accumulate(np.where(valid, 0, count))
+    continued = start * (np.cumsum(~valid) == 0)
+    return np.where(valid, count - reset + continued, 0)
+
+
+def spike_index(spike: str) -> int:
+    """
+    Converts the name of the spike to its number.
+    :param str spike: the name of the spike, for example "1.spike"
+    :return int: the number of the spike
+    """
+    return int(spike.split(".")[0])
+
+
+class SpikeStore:
+    """
+    Columnar storage of the spikes of the cells.
+    The points are kept in contiguous arrays ordered by the number of the spike, then by the cell,
+    then by the original row, so both the pooled points of a spike and the points of one cell's spike
+    are contiguous slices.
+    """
+
+    def __init__(self, names: list, cell_ids: np.ndarray, spike_ids: np.ndarray, times: np.ndarray,
+                 ifs: np.ndarray) -> None:
+        """
+        :param list names: the names of the cells
+        :param np.ndarray cell_ids: the position of the cell in names for every point
+        :param np.ndarray spike_ids: the number of the spike for every point
+        :param np.ndarray times: the relative firing times
+        :param np.ndarray ifs: the IF values
+        """
+        order = np.lexsort((cell_ids, spike_ids))
+        self.names = list(names)
+        self.cell_positions = {name: idx for idx, name in enumerate(self.names)}
+        self.cell_ids = cell_ids[order].astype(np.int32)
+        self.spike_ids = spike_ids[order].astype(np.int32)
+        self.times = np.ascontiguousarray(times[order], dtype=float)
+        self.ifs = np.ascontiguousarray(ifs[order], dtype=float)
+        self.n_spikes = int(self.spike_ids.max()) if len(self.spike_ids) else 0
+        # the points of the spike s of the cell c are offsets[k]:offsets[k + 1], k = (s - 1) * len(names) + c
+        keys = (self.spike_ids.astype(np.int64) - 1) * len(self.names) + self.cell_ids
+        counts = np.bincount(keys, minlength=self.n_spikes * len(self.names))
+        self.counts = counts.reshape(self.n_spikes, len(self.names))
+        self.offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(counts)
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, names: list) -> "SpikeStore":
+        """
+        Builds the storage from the columns of the given cells.
+        The columns are handled as one train, so the numbering only restarts at a NaN IF value.
+        :param pd.DataFrame data: the original dataframe
+        :param list names: the names of the cells
+        :return SpikeStore: the storage
+        """
+        times = data.xs("relative firing time", axis=1, level=1)[names].to_numpy(dtype=float).ravel(order="F")
+        ifs = data.xs("IF", axis=1, level=1)[names].to_numpy(dtype=float).ravel(order="F")
+        cell_ids = np.repeat(np.arange(len(names)), len(data))
+        spike_ids = spike_numbers(if_values=ifs)
+        keep = spike_ids > 0
+        return cls(names=names, cell_ids=cell_ids[keep], spike_ids=spike_ids[keep], times=times[keep],
+                   ifs=ifs[keep])
+
+    def spike_slice(self, spike: int, cell: int = None) -> slice:
+        """
+        Gives the position of a spike's points in the arrays.
+        :param int spike: the number of the spike
+        :param int cell: the position of the cell, if None the points of every cell are given
+        :return slice: the slice of the arrays
+        """
+        if spike < 1 or spike > self.n_spikes:
+            return slice(0, 0)
+        start = (spike - 1) * len(self.names)
+        if cell is None:
+            return slice(self.offsets[start], self.offsets[start + len(self.names)])
+        return slice(self.offsets[start + cell], self.offsets[start + cell + 1])
+
+    def points(self, spike: int, cell_name: str = None) -> tuple:
+        """
+        Gives the relative firing times and IFs of a spike without copying.
+        :param int spike: the number of the spike
+        :param str cell_name: the name of the cell, if None the pooled points are given
+        :return tuple: the relative firing times and the IF values
+        """
+        cell = None if cell_name is None else self.cell_positions[cell_name]
+        part = self.spike_slice(spike=spike, cell=cell)
+        return self.times[part], self.ifs[part]
+
+    def spikes_of(self, cell_name: str = None) -> np.ndarray:
+        """
+        :param str cell_name: the name of the cell, if None the spikes of every cell are given
+        :return np.ndarray: the numbers of the spikes that have points
+        """
+        if cell_name is None:
+            return np.flatnonzero(self.counts.sum(axis=1)) + 1
+        return np.flatnonzero(self.counts[:, self.cell_positions[cell_name]]) + 1
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return int: the memory used by the arrays
+        """
+        return sum(item.nbytes for item in (self.cell_ids, self.spike_ids, self.times, self.ifs, self.counts,
+                                            self.offsets))
+
+
+class SpikeView(Mapping):
+    """
+    Read-only dictionary view of the spikes of one cell or of the pooled cells:
+    {"the number of the spike": {"relative firing time": np.ndarray, "IF": np.ndarray}}
+    """
+
+    def __init__(self, store: SpikeStore, cell_name: str = None) -> None:
+        """
+        :param SpikeStore store: the storage
+        :param str cell_name: the name of the cell, if None the pooled spikes are viewed
+        """
+        self.store = store
+        self.cell_name = cell_name
+
+    def __getitem__(self, spike: str) -> dict:
+        try:
+            number = spike_index(spike=spike)
+        except (AttributeError, ValueError):
+            raise KeyError(spike)
+        times, ifs = self.store.points(spike=number, cell_name=self.cell_name)
+        if len(times) == 0:
+            raise KeyError(spike)
+        return {"relative firing time": times, "IF": ifs}
+
+    def __iter__(self):
+        return (f"{spike}.spike" for spike in self.store.spikes_of(cell_name=self.cell_name))
+
+    def __len__(self) -> int:
+        return len(self.store.spikes_of(cell_name=self.cell_name))
+
+
+class CellView(Mapping):
+    """
+    Read-only dictionary view of every cell's spikes:
+    {"the name of the cell": {"the number of the spike": {"relative firing time": np.ndarray, "IF": np.ndarray}}}
+    """
+
+    def __init__(self, store: SpikeStore) -> None:
+        """
+        :param SpikeStore store: the storage
+        """
+        self.store = store
+
+    def __getitem__(self, cell_name: str) -> SpikeView:
+        if cell_name not in self.store.cell_positions:
+            raise KeyError(cell_name)
+        return SpikeView(store=self.store, cell_name=cell_name)
+
+    def __iter__(self):
+        return iter(self.store.names)
+
+    def __len__(self) -> int:
+        return len(self.store.names)
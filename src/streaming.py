@@ -0,0 +1,203 @@
+import os
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+
+from src.datamanipulator import fit_axes, measure_counts
+from src.diagnostics import diagnose
+from src.downloader import read_excel_cache, stream_excel_cache
+from src.lm_fit import fit_values, fitted_curve, minimize_function
+from src.ols import ols_from_sums
+from src.spike_store import spike_numbers
+
+
+def open_source(source) -> pd.DataFrame:
+    """
+    Opens the data without reading it, an Excel file is converted to the memory-mapped binary cache first.
+    :param source: a dataframe or the path of the Excel file
+    :return pd.DataFrame: the data, memory-mapped if it was read from a file
+    """
+    if isinstance(source, pd.DataFrame):
+        return source
+    data = read_excel_cache(file=source)
+    if data is None:
+        if not stream_excel_cache(file=source):
+            raise ValueError(f"{os.path.basename(source)} is not numeric and can not be streamed.")
+        data = read_excel_cache(file=source)
+    return data
+
+
+def read_cells(data: pd.DataFrame, names: list = None):
+    """
+    Reads the data column pair by column pair, only the columns of the current cell are copied to memory.
+    :param pd.DataFrame data: the data, see open_source
+    :param list names: the names of the cells to read, by default every cell
+    :return: a generator of (name of the cell, relative firing times, IF values)
+    """
+    cells = [column[0] for column in data.columns][::2]
+    positions = {}
+    for idx, name in enumerate(cells):
+        positions.setdefault(name, 2 * idx)
+    names = cells if names is None else list(names)
+    missing = [name for name in names if name not in positions]
+    if missing:
+        raise KeyError(f"The cells {missing} are not in the data.")
+    for name in names:
+        position = positions[name]
+        yield name, np.array(data.iloc[:, position], dtype=float), np.array(data.iloc[:, position + 1], dtype=float)
+
+
+def spike_segments(times: np.ndarray, ifs: np.ndarray, start: int = 0) -> tuple:
+    """
+    Splits the points of a cell into its spikes, numbered like SpikeStore.from_frame.
+    :param np.ndarray times: the relative firing times of the cell
+    :param np.ndarray ifs: the IF values of the cell
+    :param int start: the number of the spikes of the previous cell's last train, if its column did not end with NaN
+    :return tuple: {number of the spike: (times, IF values)} and the start of the next cell
+    """
+    numbers = spike_numbers(if_values=ifs, start=start)
+    following = int(numbers[-1]) if len(numbers) else start
+    keep = numbers > 0
+    numbers, times, ifs = numbers[keep], times[keep], ifs[keep]
+    order = np.argsort(numbers, kind="stable")
+    numbers, times, ifs = numbers[order], times[order], ifs[order]
+    bounds = np.flatnonzero(np.diff(numbers)) + 1
+    segments = {int(part[0]): (part_times, part_ifs) for part, part_times, part_ifs in
+                zip(np.split(numbers, bounds), np.split(times, bounds), np.split(ifs, bounds)) if len(part)}
+    return segments, following
+
+
+class PooledStatistics:
+    """
+    The aggregates of the points of every spike over the cells, updated cell by cell.
+    The sums of the logarithms give the pooled log-log linear regression of a spike without keeping its points.
+    """
+    columns = ["n", "sum_time", "sum_if", "min_time", "max_time", "n_log", "sx", "sy", "sxx", "sxy", "syy"]
+
+    def __init__(self) -> None:
+        self.sums = {}
+
+    def update(self, spike: int, times: np.ndarray, ifs: np.ndarray) -> None:
+        """
+        :param int spike: the number of the spike
+        :param np.ndarray times: the relative firing times of the spike of a cell
+        :param np.ndarray ifs: the IF values of the spike of a cell
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x, y = np.log10(times), np.log10(ifs)
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = x[valid], y[valid]
+        values = np.array([len(times), np.nansum(times), np.nansum(ifs), np.nanmin(times, initial=np.inf),
+                           np.nanmax(times, initial=-np.inf), len(x), x.sum(), y.sum(), x @ x, x @ y, y @ y])
+        previous = self.sums.get(spike)
+        if previous is not None:
+            values[[0, 1, 2, 5, 6, 7, 8, 9, 10]] += previous[[0, 1, 2, 5, 6, 7, 8, 9, 10]]
+            values[3], values[4] = min(values[3], previous[3]), max(values[4], previous[4])
+        self.sums[spike] = values
+
+    def frame(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the number of the points, the means, the range of the times and the log-log regression
+        of every spike
+        """
+        spikes = sorted(self.sums)
+        sums = np.array([self.sums[spike] for spike in spikes]).reshape(-1, len(self.columns))
+        regression = ols_from_sums(n=sums[:, 5], sx=sums[:, 6], sy=sums[:, 7], sxx=sums[:, 8], sxy=sums[:, 9],
+                                   syy=sums[:, 10])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return pd.DataFrame({"n": sums[:, 0].astype(int), "mean relative firing time": sums[:, 1] / sums[:, 0],
+                                 "mean IF": sums[:, 2] / sums[:, 0], "min relative firing time": sums[:, 3],
+                                 "max relative firing time": sums[:, 4], "const": regression["params"][:, 0],
+                                 "slope": regression["params"][:, 1], "r_square": regression["rsquared"]},
+                                index=[f"{spike}.spike" for spike in spikes])
+
+
+class StreamingManipulator:
+    """
+    Processes the data cell by cell, so the memory used is proportional to one cell, not to the dataset.
+    The numbering of the spikes, the count tables and the fittings are the same as DataManipulator's.
+    """
+
+    def __init__(self, source, names: list = None) -> None:
+        """
+        :param source: a dataframe or the path of the Excel file, a file is read through the memory-mapped cache
+        :param list names: the names of the cells, by default every cell
+        """
+        self.data = open_source(source=source)
+        self.names = [x[0] for x in self.data.columns][::2] if names is None else list(names)
+        self.spike_counts = None
+        self.measure_counts = None
+        self.pooled = None
+
+    def cells(self):
+        """
+        :return: a generator of (name of the cell, {number of the spike: (times, IF values)})
+        """
+        start = 0
+        for name, times, ifs in read_cells(data=self.data, names=self.names):
+            segments, start = spike_segments(times=times, ifs=ifs, start=start)
+            yield name, segments
+
+    def scan(self) -> None:
+        """
+        Reads the cells once and updates the count tables and the pooled statistics.
+        """
+        self.spike_counts, self.measure_counts, self.pooled = {}, {}, PooledStatistics()
+        start = 0
+        for name, times, ifs in read_cells(data=self.data, names=self.names):
+            self.measure_counts[name] = {f"{idx + 1}.measure": count
+                                         for idx, count in enumerate(measure_counts(times=times, ifs=ifs))}
+            segments, start = spike_segments(times=times, ifs=ifs, start=start)
+            self.spike_counts[name] = {f"{spike}.spike": len(points[0]) for spike, points in segments.items()}
+            for spike, (spike_times, spike_ifs) in segments.items():
+                self.pooled.update(spike=spike, times=spike_times, ifs=spike_ifs)
+
+    def create_spike_frame(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the number of the points of every spike of the cells, see DataManipulator
+        """
+        if self.spike_counts is None:
+            self.scan()
+        return pd.DataFrame(self.spike_counts).transpose().fillna(0)
+
+    def measurements(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the number of the points of every measurement of the cells, see DataManipulator
+        """
+        if self.measure_counts is None:
+            self.scan()
+        return pd.DataFrame(self.measure_counts).transpose().fillna(0)
+
+    def pooled_statistics(self) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: the statistics of the points of every spike over the cells, see PooledStatistics
+        """
+        if self.pooled is None:
+            self.scan()
+        return self.pooled.frame()
+
+    def fit_cells(self, func_class, param_values: tuple, range_spike: int, log: bool = True,
+                  switch_axes: bool = False):
+        """
+        Fits the first spikes of every cell one cell at a time, like LMFit.create_lmfit_curve_fit for one cell.
+        The spikes with fewer points than parameters are skipped.
+        :param func_class: the func_class that includes the equation of the curve to be fitted
+        :param tuple param_values: the initial value and the lower bound of the parameters
+        :param int range_spike: the number of the fitted spikes
+        :param bool log: if true the logarithm of the values is fitted
+        :param bool switch_axes: if true IF is the independent variable
+        :return: a generator of dicts with the cell, the spike, the parameters and the diagnostics of the fitting
+        """
+        for name, segments in self.cells():
+            for spike in range(1, range_spike + 1):
+                if spike not in segments or len(segments[spike][0]) < func_class.n_params:
+                    continue
+                x, data = fit_axes(times=segments[spike][0], ifs=segments[spike][1], log=log,
+                                   switch_axes=switch_axes)
+                result, _ = minimize_function(func_class=func_class, param_values=param_values, x=x, data=data)
+                values = fit_values(result=result, n_params=func_class.n_params)
+                fitted = fitted_curve(func_class=func_class, result=result, x=x)
+                statistics = diagnose(result=result, data=data, fitted=fitted, n_params=func_class.n_params, log=log)
+                yield {"cell": name, "spike": f"{spike}.spike",
+                       **{f"a{i + 1}_param": value for i, value in enumerate(values)}, **asdict(statistics)}
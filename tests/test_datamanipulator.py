@@ -0,0 +1,170 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_dataset
+from src.cache import LRUCache
+from src.datamanipulator import DataManipulator, descending_order
+from src.spike_store import SpikeStore
+from src.streaming import StreamingManipulator, read_cells
+
+nan = np.nan
+
+
+def reference_spike_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    The loops of the original DataManipulator.create_cell_dict and create_spike_frame, counting only.
+    The number of the spike is not reset between the cells, only at a NaN IF value.
+    """
+    counts = {}
+    spike = 1
+    for name in [x[0] for x in data.columns][::2]:
+        counts[name] = {}
+        for value in data[name]["IF"]:
+            if math.isnan(value):
+                spike = 1
+            else:
+                counts[name][spike] = counts[name].get(spike, 0) + 1
+                spike += 1
+    n_dict = {name: {f"{spike}.spike": cell[spike] for spike in range(1, len(cell) + 1)}
+              for name, cell in counts.items()}
+    return pd.DataFrame(n_dict).transpose().fillna(0)
+
+
+def reference_measurements(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    The loop of the original DataManipulator.measurements, counting only.
+    """
+    n_dict = {}
+    for name in [x[0] for x in data.columns][::2]:
+        times, ifs = list(data[name]["relative firing time"]), list(data[name]["IF"])
+        counts = {}
+        measure = 1
+        for idx in range(len(times) - 1):
+            if math.isnan(times[idx + 1]):
+                continue
+            counts.setdefault(measure, 0)
+            if times[idx] < times[idx + 1]:
+                counts[measure] = 1 if not math.isnan(ifs[idx]) else counts[measure] + 1
+            else:
+                counts[measure] += 1
+                measure += 1
+        n_dict[name] = {f"{idx}.measure": counts[idx] for idx in range(1, len(counts) + 1)}
+    return pd.DataFrame(n_dict).transpose().fillna(0)
+
+
+@pytest.fixture
+def data() -> pd.DataFrame:
+    """
+    Three cells: "a" does not end with NaN, so its last train continues in "b", whose column ends with NaN.
+    "c" has a NaN time with an IF value and a train of one point.
+    """
+    return pd.DataFrame({("a", "relative firing time"): [10, 5, 2, nan, 8, 4, 1, 0.5],
+                         ("a", "IF"): [1, 2, 3, nan, 1, 2, 3, 4],
+                         ("b", "relative firing time"): [3, 1, nan, 9, 6, 7, 5, nan],
+                         ("b", "IF"): [5, 6, nan, 1, 2, 3, 4, nan],
+                         ("c", "relative firing time"): [2, 4, 8, 6, nan, 5, nan, nan],
+                         ("c", "IF"): [1, 2, nan, 4, nan, 5, nan, nan]})
+
+
+def test_spike_frame_carries_the_numbering_over_the_columns(data):
+    expected = pd.DataFrame([[2, 2, 2, 1, 0, 0], [1, 1, 1, 1, 1, 1], [3, 1, 0, 0, 0, 0]], index=["a", "b", "c"],
+                            columns=[f"{spike}.spike" for spike in range(1, 7)], dtype=float)
+    frame = DataManipulator(data).create_spike_frame()
+    pd.testing.assert_frame_equal(frame, expected)
+    pd.testing.assert_frame_equal(frame, reference_spike_frame(data))
+
+
+def test_measurements(data):
+    expected = pd.DataFrame([[1, 1, 1, 1, 1, 1], [1, 1, 1, 2, 0, 0], [2, 1, 0, 0, 0, 0]], index=["a", "b", "c"],
+                            columns=[f"{idx}.measure" for idx in range(1, 7)], dtype=float)
+    measurements = DataManipulator(data).measurements()
+    pd.testing.assert_frame_equal(measurements, expected)
+    pd.testing.assert_frame_equal(measurements, reference_measurements(data))
+
+
+@pytest.mark.parametrize("ragged", [True, False])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_frames_match_the_original_loops(ragged, seed):
+    data = make_dataset(n_cells=12, trains_per_cell=3, spikes_per_train=6, ragged=ragged, seed=seed)
+    data_class = DataManipulator(data)
+    pd.testing.assert_frame_equal(data_class.create_spike_frame(), reference_spike_frame(data))
+    pd.testing.assert_frame_equal(data_class.measurements(), reference_measurements(data))
+
+
+def test_pooled_points_keep_the_order_of_the_cells(data):
+    data_class = DataManipulator(data)
+    points = data_class.all_in_one_dict["1.spike"]
+    np.testing.assert_array_equal(points["relative firing time"], [10, 8, 9, 2, 6, 5])
+    np.testing.assert_array_equal(points["IF"], [1, 1, 1, 1, 4, 5])
+    assert list(data_class.dict["b"]) == ["1.spike", "2.spike", "3.spike", "4.spike", "5.spike", "6.spike"]
+    np.testing.assert_array_equal(data_class.dict["b"]["5.spike"]["relative firing time"], [3])
+
+
+@pytest.mark.parametrize("values", [[3., 1., 3., 2., 1., 3.], [2., nan, 5., 2., nan, 5., 0.], [nan, nan], [],
+                                    [1., 1., 1.]])
+def test_descending_order_is_stable_like_sort_values(values):
+    values = np.array(values, dtype=float)
+    expected = pd.Series(values).sort_values(ascending=False).index.to_numpy()
+    np.testing.assert_array_equal(descending_order(values=values), expected)
+
+
+def test_descending_order_keeps_the_ties_in_place():
+    np.testing.assert_array_equal(descending_order(values=np.array([1., 3., nan, 3., 2., 1.])), [1, 3, 4, 0, 5, 2])
+
+
+def test_spike_store_offsets():
+    store = SpikeStore(names=["a", "b"], cell_ids=np.array([1, 0, 0, 1, 0, 1]),
+                       spike_ids=np.array([1, 1, 2, 2, 1, 3]), times=np.arange(6.), ifs=np.arange(6.) * 10)
+    np.testing.assert_array_equal(store.counts, [[2, 1], [1, 1], [0, 1]])
+    np.testing.assert_array_equal(store.offsets, [0, 2, 3, 4, 5, 5, 6])
+    assert store.n_spikes == 3
+    assert store.spike_slice(spike=1) == slice(0, 3)
+    assert store.spike_slice(spike=3, cell=0) == slice(5, 5)
+    assert store.spike_slice(spike=4) == slice(0, 0)
+    # the points of a spike of a cell keep their original order
+    np.testing.assert_array_equal(store.points(spike=1, cell_name="a")[0], [1., 4.])
+    np.testing.assert_array_equal(store.points(spike=1)[0], [1., 4., 0.])
+    np.testing.assert_array_equal(store.points(spike=3, cell_name="b")[1], [50.])
+    np.testing.assert_array_equal(store.spikes_of(cell_name="a"), [1, 2])
+    np.testing.assert_array_equal(store.spikes_of(), [1, 2, 3])
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    builds = []
+
+    def build(key):
+        return lambda: builds.append(key) or key.upper()
+
+    assert cache.get(key="a", build=build("a")) == "A"
+    cache.get(key="b", build=build("b"))
+    cache.get(key="a", build=build("a"))
+    cache.get(key="c", build=build("c"))
+    assert list(cache.items) == ["a", "c"]
+    cache.get(key="b", build=build("b"))
+    assert builds == ["a", "b", "c", "b"]
+    assert cache.info() == {"hits": 1, "misses": 4, "size": 2, "maxsize": 2}
+    cache.clear()
+    assert cache.info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 2}
+
+
+def test_lru_cache_without_size_does_not_store():
+    cache = LRUCache(maxsize=0)
+    assert cache.get(key="a", build=lambda: 1) == 1
+    assert cache.get(key="a", build=lambda: 2) == 2
+    assert cache.info() == {"hits": 0, "misses": 2, "size": 0, "maxsize": 0}
+
+
+def test_streaming_matches_the_frames(data):
+    streaming = StreamingManipulator(source=data)
+    pd.testing.assert_frame_equal(streaming.create_spike_frame(), DataManipulator(data).create_spike_frame())
+    pd.testing.assert_frame_equal(streaming.measurements(), DataManipulator(data).measurements())
+
+
+def test_read_cells_names_the_missing_cell(data):
+    assert [name for name, _, _ in read_cells(data=data, names=["c", "a"])] == ["c", "a"]
+    with pytest.raises(KeyError, match="'d'"):
+        list(read_cells(data=data, names=["a", "d"]))
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.downloader import download_file, make_session
+
+BODY = bytes(range(256)) * 40
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves server.body, with Range support if server.honor_range is true.
+    The first server.truncate responses announce the whole length but stop in the middle.
+    """
+
+    def do_GET(self) -> None:
+        server = self.server
+        requested = self.headers.get("Range")
+        server.ranges.append(requested)
+        start = 0
+        if requested is not None and server.honor_range:
+            start = int(requested.split("=")[1].split("-")[0])
+            if start >= len(server.body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(server.body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(server.body) - 1}/{len(server.body)}")
+        else:
+            self.send_response(200)
+        payload = server.body[start:]
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if server.truncate > 0:
+            server.truncate -= 1
+            self.wfile.write(payload[:len(payload) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.body, server.honor_range, server.truncate, server.ranges = BODY, True, 0, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/data.xlsx"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def download(server, file, **kwargs) -> str:
+    return download_file(url=server.url, file=str(file), session=make_session(pool_size=1), backoff=0, timeout=5,
+                         chunk_size=512, **kwargs)
+
+
+def test_resumes_from_the_partial_file(server, tmp_path):
+    target = tmp_path / "data.xlsx"
+    (tmp_path / "data.xlsx.part").write_bytes(BODY[:1000])
+    download(server, target, sha256=hashlib.sha256(BODY).hexdigest())
+    assert target.read_bytes() == BODY
+    assert server.ranges == ["bytes=1000-"]
+    assert not (tmp_path / "data.xlsx.part").exists()
+
+
+def test_a_complete_partial_file_is_not_downloaded_again(server, tmp_path):
+    target = tmp_path / "data.xlsx"
+    (tmp_path / "data.xlsx.part").write_bytes(BODY)
+    download(server, target)
+    assert target.read_bytes() == BODY
+    assert server.ranges == [f"bytes={len(BODY)}-"]
+
+
+def test_a_truncated_response_is_continued_by_the_retry(server, tmp_path):
+    server.truncate = 1
+    target = tmp_path / "data.xlsx"
+    download(server, target, retries=2)
+    assert target.read_bytes() == BODY
+    assert server.ranges == [None, f"bytes={len(BODY) // 2}-"]
+
+
+def test_the_retries_run_out(server, tmp_path):
+    server.truncate = 3
+    target = tmp_path / "data.xlsx"
+    with pytest.raises(IOError):
+        download(server, target, retries=1)
+    assert not target.exists()
+    assert len(server.ranges) == 2
+
+
+def test_a_hash_mismatch_keeps_the_old_file(server, tmp_path):
+    target = tmp_path / "data.xlsx"
+    target.write_bytes(b"old version")
+    with pytest.raises(ValueError):
+        download(server, target, sha256=hashlib.sha256(b"something else").hexdigest())
+    assert target.read_bytes() == b"old version"
+    assert not (tmp_path / "data.xlsx.part").exists()
+
+
+def test_a_server_without_range_support_restarts_the_file(server, tmp_path):
+    server.honor_range = False
+    target = tmp_path / "data.xlsx"
+    (tmp_path / "data.xlsx.part").write_bytes(b"stale bytes" * 50)
+    download(server, target)
+    assert target.read_bytes() == BODY
+    assert server.ranges == [f"bytes={len(b'stale bytes') * 50}-"]
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.evaluate import Evaluate
+from src.ols import ols_from_sums, prefix_statistics, sufficient_statistics
+
+# statsmodels 0.14 OLS(y, add_constant(x)).fit() of these points
+X = pd.Series([2.3, 2.1, 1.9, 1.6, 1.4, 1.1, 0.8, 0.5], name="relative firing time")
+Y = np.array([0.9, 1.0, 1.15, 1.2, 1.4, 1.5, 1.7, 1.85])
+PARAMS = [2.1047450110864743, -0.5246119733924614]
+PVALUES = [1.2558496561906431e-09, 3.3112998151077623e-07]
+CONF_INT = [[2.0208520105373284, 2.18863801163562], [-0.5777636626761857, -0.4714602841087369]]
+RSQUARED = 0.9898181252364938
+FVALUE = 583.2824395665484
+F_PVALUE = 3.311299815107766e-07
+
+
+def spike_frame(n_points: int, seed: int) -> pd.DataFrame:
+    """
+    The logarithm of the points of a spike, like the frames of Evaluate.count_if_threshold.
+    """
+    rng = np.random.default_rng(seed)
+    times = np.sort(rng.uniform(1, 250, n_points))[::-1]
+    ifs = 300 * times ** -0.5 * rng.lognormal(0, 0.1, n_points)
+    return np.log10(pd.DataFrame({"relative firing time": times, "IF": ifs}))
+
+
+def test_linear_regression_matches_the_reference_values():
+    p, r_square, conf_int, fp, f, params = Evaluate.linear_regression(x=X, y=Y)
+    assert list(params.index) == ["const", "relative firing time"]
+    np.testing.assert_allclose(params, PARAMS, rtol=1e-10)
+    np.testing.assert_allclose(p, PVALUES, rtol=1e-6)
+    np.testing.assert_allclose(conf_int, CONF_INT, rtol=1e-10)
+    assert r_square == pytest.approx(RSQUARED, rel=1e-12)
+    assert f == pytest.approx(FVALUE, rel=1e-9)
+    assert fp == pytest.approx(F_PVALUE, rel=1e-6)
+
+
+def test_shifted_sums_give_the_same_regression():
+    plain = ols_from_sums(**sufficient_statistics(x=X, y=Y))
+    shift = (X.mean(), Y.mean())
+    shifted = ols_from_sums(**sufficient_statistics(x=X, y=Y, shift=shift), shift=shift)
+    for key in plain:
+        np.testing.assert_allclose(shifted[key], plain[key], rtol=1e-9)
+
+
+def test_prefix_statistics_are_the_sums_of_the_first_points():
+    order = np.array([3, 0, 2, 1])
+    x, y = np.array([1., 2., 3., 4.]), np.array([5., 6., 7., 8.])
+    sums = prefix_statistics(x=x, y=y, order=order, counts=[0, 2, 4])
+    np.testing.assert_array_equal(sums["n"], [0, 2, 4])
+    np.testing.assert_allclose(sums["sx"], [0, 5, 10])
+    np.testing.assert_allclose(sums["sxy"], [0, 37, 70])
+
+
+def test_too_few_points_give_nan():
+    result = ols_from_sums(**sufficient_statistics(x=[1., 2.], y=[3., 5.]))
+    np.testing.assert_allclose(result["params"], [1., 2.])
+    assert np.isnan(result["pvalues"]).all()
+    assert np.isnan(result["conf_int"]).all()
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_linear_regression_matches_statsmodels(seed):
+    sm = pytest.importorskip("statsmodels.api")
+    frame = spike_frame(n_points=40, seed=seed)
+    x, y = frame["relative firing time"], frame["IF"]
+    expected = sm.OLS(y, sm.add_constant(x)).fit()
+    p, r_square, conf_int, fp, f, params = Evaluate.linear_regression(x=x, y=y)
+    pd.testing.assert_series_equal(params, expected.params, rtol=1e-9)
+    pd.testing.assert_series_equal(p, expected.pvalues, rtol=1e-6)
+    pd.testing.assert_frame_equal(conf_int, expected.conf_int(alpha=0.05), rtol=1e-9)
+    assert r_square == pytest.approx(expected.rsquared, rel=1e-10)
+    assert f == pytest.approx(expected.fvalue, rel=1e-8)
+    assert fp == pytest.approx(expected.f_pvalue, rel=1e-6)
+
+
+@pytest.mark.parametrize("thresholds", [[25, 30, 40, 80, 400], [80, 25, 400, 40, 30], [40, 40, 28]])
+def test_threshold_regressions_match_statsmodels(thresholds):
+    sm = pytest.importorskip("statsmodels.api")
+    frame = spike_frame(n_points=60, seed=2)
+    thresholds = np.log10(thresholds)
+    regressions = Evaluate.threshold_linear_regression(frame=frame, thresholds=thresholds)
+    assert len(regressions) == len(thresholds)
+    for threshold, (p, r_square, conf_int, fp, f, params) in zip(thresholds, regressions):
+        points = frame[frame["IF"] <= threshold]
+        expected = sm.OLS(points["IF"], sm.add_constant(points["relative firing time"])).fit()
+        np.testing.assert_allclose(params, expected.params, rtol=1e-8)
+        np.testing.assert_allclose(p, expected.pvalues, rtol=1e-5)
+        np.testing.assert_allclose(conf_int, expected.conf_int(alpha=0.05), rtol=1e-8)
+        assert r_square == pytest.approx(expected.rsquared, rel=1e-9)
+        assert f == pytest.approx(expected.fvalue, rel=1e-7)
+        assert fp == pytest.approx(expected.f_pvalue, rel=1e-5)
+
+
+def test_threshold_regressions_are_the_regressions_of_the_points_under_them():
+    frame = spike_frame(n_points=60, seed=3)
+    thresholds = np.log10([80, 25, 400, 40, 30, 40])
+    regressions = Evaluate.threshold_linear_regression(frame=frame, thresholds=thresholds)
+    for threshold, outputs in zip(thresholds, regressions):
+        points = frame[frame["IF"] <= threshold]
+        expected = Evaluate.linear_regression(x=points["relative firing time"], y=points["IF"])
+        for value, reference in zip(outputs, expected):
+            np.testing.assert_allclose(value, reference, rtol=1e-8)
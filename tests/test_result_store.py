@@ -0,0 +1,44 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.result_store import ResultStore, fit_tables
+
+
+def tables(model: str, cell: str) -> dict:
+    df_n = pd.DataFrame({"a": [1., 2.], "b": [3., 4.]}, index=[1, 2])
+    df_params = pd.DataFrame({"chisqr": [0.5, 0.25]}, index=[1, 2])
+    points = {0: {"x": [1., 2.], "data": [3., 4.]}, 1: {"x": [5.], "data": [6.]}}
+    return fit_tables(model=model, cell=cell, df_n=df_n, df_params=df_params, points=points)
+
+
+def test_every_part_has_its_own_entry(tmp_path):
+    store = ResultStore(directory=str(tmp_path))
+    first = store.append(tables=tables(model="power", cell="all"), metadata={"log": True})
+    second = store.append(tables=tables(model="exp", cell="a"))
+    assert [entry["run_id"] for entry in store.manifest()] == [first, second]
+    assert sorted(os.listdir(tmp_path)) == sorted([f"{first}.json", f"{first}.npz", f"{second}.json",
+                                                   f"{second}.npz"])
+    assert store.manifest()[0]["models"] == ["power"]
+    assert list(store.runs()["run_id"]) == [first, second]
+
+
+def test_concurrent_writers_keep_every_entry(tmp_path):
+    store = ResultStore(directory=str(tmp_path))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        run_ids = list(pool.map(lambda idx: store.append(tables=tables(model=f"model {idx}", cell="all")), range(32)))
+    assert sorted(entry["run_id"] for entry in store.manifest()) == sorted(run_ids)
+
+
+def test_query_reads_the_matching_rows(tmp_path):
+    store = ResultStore(directory=str(tmp_path))
+    store.append(tables=tables(model="power", cell="all"))
+    run_id = store.append(tables=tables(model="exp", cell="all"))
+    params = store.query(table="params", model="exp", spike=2)
+    assert list(params["run_id"]) == [run_id]
+    np.testing.assert_array_equal(params[["a", "b"]].to_numpy(), [[2., 4.]])
+    points = store.query(table="points", cell="all", columns=["x", "data"])
+    assert len(points) == 6
+    assert store.query(table="params", model="missing").empty